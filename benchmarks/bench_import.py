@@ -0,0 +1,53 @@
+"""
+Startup benchmark: cold import and configure time of subspace, measured in
+fresh interpreters so module caches never carry over between samples.
+"""
+import json
+import subprocess
+import sys
+
+
+# Each snippet prints the seconds it took as JSON on its last line.
+SNIPPETS = {
+    'import_subspace': "import subspace",
+    'import_subspace_runner': "import subspace.runner",
+    'configure': "import subspace; subspace.configure({'HOST_KEY_CHECKING': False})",
+}
+
+TIMER = (
+    "import json, sys, time\n"
+    "sys.path.insert(0, %r)\n"
+    "start = time.time()\n"
+    "%s\n"
+    "print(json.dumps(time.time() - start))\n"
+)
+
+
+def _measure(code, root):
+    process = subprocess.Popen(
+        [sys.executable, '-c', TIMER % (root, code)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = process.communicate()
+    if process.returncode != 0:
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else 'exit code %s' % process.returncode)
+    return json.loads(stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def run(root, repeat=5):
+    """
+    Return min/median seconds per snippet over `repeat` cold starts.
+    `root` is the directory containing the subspace package.
+    """
+    results = []
+    for name in sorted(SNIPPETS):
+        entry = {'name': name, 'repeat': repeat}
+        try:
+            samples = sorted(_measure(SNIPPETS[name], root) for _ in range(repeat))
+        except RuntimeError as exc:
+            entry['error'] = str(exc)
+        else:
+            entry['min_seconds'] = samples[0]
+            entry['median_seconds'] = samples[len(samples) // 2]
+        results.append(entry)
+    return results
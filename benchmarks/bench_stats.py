@@ -0,0 +1,60 @@
+"""
+Micro-benchmark for SubspaceAggregateStats.increment, the call the
+strategy makes for every task result of every host.
+"""
+import time
+
+from subspace.stats import SubspaceAggregateStats
+
+
+class _Role(object):
+
+    def __init__(self, name):
+        self._role_name = name
+
+
+class _Play(object):
+
+    def __init__(self, name):
+        self.name = name
+        self._uuid = name.replace(' ', '-')
+
+
+class _Task(object):
+
+    def __init__(self, name, role):
+        self.name = name
+        self._role = role
+
+
+def run(num_hosts=1000, num_tasks=50, num_plays=5):
+    """
+    Increment 'ok' and 'failures' for every (host, play, task) combination
+    and return the elapsed time and increments per second.
+    """
+    plays = [_Play('Play %d' % idx) for idx in range(num_plays)]
+    tasks = [_Task('Task %d' % idx, _Role('role_%d' % (idx % 10)))
+             for idx in range(num_tasks)]
+    hosts = ['host-%05d' % idx for idx in range(num_hosts)]
+
+    stats = SubspaceAggregateStats()
+    for idx, play in enumerate(plays):
+        stats.register_play(play, '/playbooks/%02d.yml' % idx)
+    increments = 0
+    start = time.time()
+    for play in plays:
+        for task in tasks:
+            for host in hosts:
+                stats.increment('ok', host, play, task)
+                stats.increment('failures', host, play, task)
+                increments += 2
+    elapsed = time.time() - start
+    return {
+        'name': 'stats_increment',
+        'hosts': num_hosts,
+        'tasks': num_tasks,
+        'plays': num_plays,
+        'increments': increments,
+        'wall_seconds': elapsed,
+        'increments_per_second': increments / elapsed if elapsed else None,
+    }
@@ -0,0 +1,221 @@
+"""
+subspace benchmark suite.
+
+Runs synthetic inventories and playbook trees through subspace.Runner and
+records controller-side throughput, per-phase latency and peak memory as
+JSON, so results can be compared between releases:
+
+    python benchmarks/run.py --hosts 10,100,1000 --output bench.json
+
+Every runner scenario executes in its own Python process so that peak RSS
+and import state are not shared between scenarios. The in-process
+micro-benchmarks run after the scenarios, as a worker would otherwise
+inherit their peak RSS.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import bench_import
+import bench_stats
+import synthetic
+
+
+DEFAULT_HOSTS = '10,100,1000'
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes on macOS, kilobytes on Linux.
+        peak = peak // 1024
+    return peak
+
+
+def run_scenario(spec):
+    """
+    Generate the tree described by `spec` and run it through Runner.
+    Executed inside the worker process.
+    """
+    import_start = time.time()
+    from subspace import metrics
+    from subspace.profiler import Profiler
+    from subspace.runner import Runner
+    import_seconds = time.time() - import_start
+
+    root = spec['root']
+    (inventory_path, playbook_dir, names) = synthetic.generate_tree(
+        root, spec['hosts'],
+        num_playbooks=spec['playbooks'],
+        roles_per_playbook=spec['roles'],
+        tasks_per_role=spec['tasks'],
+        loop_items=spec['loop_items'],
+    )
+
+    logger = logging.getLogger('subspace.benchmark')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    metrics.enable()
+    profile = Profiler(os.path.join(root, 'profile'), interval=0)
+    start = time.time()
+    stub_options = None
+    if spec['connection'] == 'stub':
+        stub_options = {'latency': spec['stub_latency'],
+                        'failure_rate': spec['stub_failure_rate'],
+                        'seed': 0}
+    runner = Runner.factory(
+        inventory_path, playbook_dir, logger,
+        private_key_file=None,
+        connection=spec['connection'],
+        forks=spec['forks'],
+        limit_hosts=','.join(names),
+        profile=profile,
+        stub_options=stub_options)
+    rc = runner.run()
+    wall_seconds = time.time() - start
+
+    stats = runner.stats
+    task_results = 0
+    for what in ('ok', 'failures', 'dark', 'skipped'):
+        task_results += sum(getattr(stats, what).values())
+
+    return dict(spec,
+                rc=rc,
+                import_seconds=import_seconds,
+                wall_seconds=wall_seconds,
+                task_results=task_results,
+                results_per_second=task_results / wall_seconds if wall_seconds else None,
+                processed_hosts=len(stats.processed),
+                peak_rss_kb=_peak_rss_kb(),
+                phases=profile.breakdown())
+
+
+def _spawn(spec, workdir):
+    spec_path = os.path.join(workdir, 'spec.json')
+    result_path = os.path.join(workdir, 'result.json')
+    log_path = os.path.join(workdir, 'output.log')
+    with open(spec_path, 'w') as the_file:
+        json.dump(spec, the_file)
+    with open(log_path, 'w') as log:
+        returncode = subprocess.call(
+            [sys.executable, os.path.abspath(__file__),
+             '--worker', spec_path, result_path],
+            stdout=log, stderr=subprocess.STDOUT)
+    if returncode != 0 or not os.path.exists(result_path):
+        return dict(spec, error="worker exited with %s, see %s" % (returncode, log_path))
+    with open(result_path) as the_file:
+        return json.load(the_file)
+
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    try:
+        from subspace.version import get_version
+        versions['subspace'] = get_version('short')
+    except Exception:
+        pass
+    try:
+        import ansible.release
+        versions['ansible'] = ansible.release.__version__
+    except Exception:
+        pass
+    return versions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hosts', default=DEFAULT_HOSTS,
+                        help="Comma separated host counts (default: %s)" % DEFAULT_HOSTS)
+    parser.add_argument('--playbooks', type=int, default=3)
+    parser.add_argument('--roles', type=int, default=2, help="Roles per playbook")
+    parser.add_argument('--tasks', type=int, default=5, help="Tasks per role")
+    parser.add_argument('--loop-items', type=int, default=3)
+    parser.add_argument('--forks', type=int, default=50)
+    parser.add_argument('--connection', default='local',
+                        help="'local', or 'stub' to measure subspace overhead only")
+    parser.add_argument('--stub-latency', type=float, default=0.0,
+                        help="Seconds per module run with --connection stub")
+    parser.add_argument('--stub-failure-rate', type=float, default=0.0,
+                        help="Fraction of failing module runs with --connection stub")
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--workdir', default=None,
+                        help="Where trees are generated (default: a temporary directory)")
+    parser.add_argument('--keep', action='store_true',
+                        help="Keep generated trees and worker logs")
+    parser.add_argument('--micro-only', action='store_true',
+                        help="Only run the in-process micro-benchmarks")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == '--worker':
+        (spec_path, result_path) = argv[1:3]
+        with open(spec_path) as the_file:
+            spec = json.load(the_file)
+        result = run_scenario(spec)
+        with open(result_path, 'w') as the_file:
+            json.dump(result, the_file, indent=2, sort_keys=True)
+        return 0
+
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='subspace-bench-')
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'versions': _versions(),
+        'scenarios': [],
+    }
+    try:
+        if not args.micro_only:
+            for num_hosts in [int(count) for count in args.hosts.split(',') if count]:
+                scenario_dir = os.path.join(workdir, 'hosts-%d' % num_hosts)
+                os.makedirs(scenario_dir)
+                spec = {
+                    'root': scenario_dir,
+                    'hosts': num_hosts,
+                    'playbooks': args.playbooks,
+                    'roles': args.roles,
+                    'tasks': args.tasks,
+                    'loop_items': args.loop_items,
+                    'forks': args.forks,
+                    'connection': args.connection,
+                    'stub_latency': args.stub_latency,
+                    'stub_failure_rate': args.stub_failure_rate,
+                }
+                print("Running %d hosts with connection=%s ..." % (num_hosts, args.connection))
+                result = _spawn(spec, scenario_dir)
+                report['scenarios'].append(result)
+                print("  %s" % (result.get('error') or
+                                "%(wall_seconds).2fs, %(results_per_second).1f results/s, "
+                                "peak %(peak_rss_kb)d KB" % result))
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # After the scenarios: workers inherit the peak RSS of this process
+    report['micro'] = [bench_stats.run()]
+    report['startup'] = bench_import.run(os.path.dirname(BENCH_DIR))
+
+    with open(args.output, 'w') as the_file:
+        json.dump(report, the_file, indent=2, sort_keys=True)
+    print("Results written to %s" % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
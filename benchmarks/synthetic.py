@@ -0,0 +1,137 @@
+"""
+Generate synthetic inventories and playbook trees for the subspace benchmarks.
+
+The generated layout looks like:
+
+    <root>/hosts                       INI inventory with N hosts in G groups
+    <root>/playbooks/00_play.yml ...   the playbook directory given to Runner
+    <root>/roles/role_XX/...           roles with tasks, loops and handlers
+    <root>/tasks/include_XX.yml        task files pulled in with `include`
+
+Roles and included files live outside of `playbooks/` because
+Runner._get_files treats every .yml below that directory as a playbook;
+playbooks reference them by absolute path.
+"""
+from __future__ import print_function
+
+import os
+import sys
+
+import yaml
+
+
+__all__ = ['generate_inventory', 'generate_playbooks', 'generate_tree']
+
+
+def _write_yaml(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as the_file:
+        yaml.safe_dump(data, the_file, default_flow_style=False)
+    return path
+
+
+def host_names(num_hosts):
+    return ['bench-host-%05d' % idx for idx in range(num_hosts)]
+
+
+def generate_inventory(path, num_hosts, num_groups=4, host_vars=5):
+    """
+    Write an INI inventory with `num_hosts` hosts spread over `num_groups`
+    groups, each host carrying `host_vars` variables.
+    """
+    names = host_names(num_hosts)
+    groups = dict(('group_%02d' % idx, []) for idx in range(max(num_groups, 1)))
+    group_names = sorted(groups)
+    for idx, name in enumerate(names):
+        groups[group_names[idx % len(group_names)]].append(name)
+
+    lines = []
+    for group in group_names:
+        lines.append('[%s]' % group)
+        for name in groups[group]:
+            variables = ' '.join('bench_var_%d=%s-%d' % (var, name, var)
+                                 for var in range(host_vars))
+            lines.append('%s %s' % (name, variables))
+        lines.append('')
+    lines.append('[all:vars]')
+    lines.append('ansible_python_interpreter=%s' % sys.executable)
+    lines.append('')
+    with open(path, 'w') as the_file:
+        the_file.write('\n'.join(lines))
+    return names
+
+
+def _role(root, idx, tasks_per_role, loop_items):
+    role_dir = os.path.join(root, 'roles', 'role_%02d' % idx)
+    tasks = []
+    for task in range(tasks_per_role):
+        tasks.append({
+            'name': 'role_%02d task %d' % (idx, task),
+            'set_fact': {'role_%02d_fact_%d' % (idx, task): '{{ inventory_hostname }}-%d' % task},
+        })
+    tasks.append({
+        'name': 'role_%02d loop' % idx,
+        'debug': {'msg': 'item {{ item }}'},
+        'with_items': list(range(loop_items)),
+    })
+    tasks.append({
+        'name': 'role_%02d changed' % idx,
+        'command': '/bin/true',
+        'notify': ['role_%02d handler' % idx],
+    })
+    _write_yaml(os.path.join(role_dir, 'tasks', 'main.yml'), tasks)
+    _write_yaml(os.path.join(role_dir, 'handlers', 'main.yml'), [{
+        'name': 'role_%02d handler' % idx,
+        'debug': {'msg': 'handled by {{ inventory_hostname }}'},
+    }])
+    return role_dir
+
+
+def _include(root, idx, tasks_per_include):
+    path = os.path.join(root, 'tasks', 'include_%02d.yml' % idx)
+    tasks = [{
+        'name': 'include_%02d task %d' % (idx, task),
+        'debug': {'msg': '{{ bench_var_0 | default("none") }}'},
+    } for task in range(tasks_per_include)]
+    return _write_yaml(path, tasks)
+
+
+def generate_playbooks(root, num_playbooks=3, roles_per_playbook=2,
+                       tasks_per_role=5, loop_items=3, tasks_per_include=3,
+                       gather_facts=False):
+    """
+    Write `num_playbooks` playbooks into `<root>/playbooks`, each with roles
+    (tasks, a loop, a notifying task and a handler) and an included task file.
+    Returns the playbook directory.
+    """
+    playbook_dir = os.path.join(root, 'playbooks')
+    for pb_idx in range(num_playbooks):
+        roles = []
+        for role_idx in range(roles_per_playbook):
+            roles.append(_role(root, pb_idx * roles_per_playbook + role_idx,
+                               tasks_per_role, loop_items))
+        include_path = _include(root, pb_idx, tasks_per_include)
+        play = {
+            'name': 'Benchmark play %02d' % pb_idx,
+            'hosts': 'all',
+            'gather_facts': gather_facts,
+            'roles': roles,
+            'tasks': [{'include': include_path}],
+        }
+        _write_yaml(os.path.join(playbook_dir, '%02d_play.yml' % pb_idx), [play])
+    return playbook_dir
+
+
+def generate_tree(root, num_hosts, **playbook_kwargs):
+    """
+    Generate an inventory and playbook tree below `root`.
+    Returns (inventory_path, playbook_dir, host_names).
+    """
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    inventory_path = os.path.join(root, 'hosts')
+    names = generate_inventory(inventory_path, num_hosts)
+    playbook_dir = generate_playbooks(root, **playbook_kwargs)
+    return (inventory_path, playbook_dir, names)
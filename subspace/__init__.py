@@ -2,16 +2,28 @@ from .version import VERSION
 
 __all__ = ['configure', 'VERSION']
 
-def configure(settings=None):
+def configure(settings=None, reload_config=False):
+    """
+    Apply `settings` (ex: {"HOST_KEY_CHECKING": False}) to ansible.constants.
+
+    Settings are assigned in place; every Ansible module reads them through
+    the shared `ansible.constants` module, so nothing needs to be reloaded.
+    Pass reload_config=True to re-read ansible.cfg and ANSIBLE_* environment
+    variables first (ex: after changing ANSIBLE_CONFIG).
+
+    These settings stay in effect for the whole process. To use different
+    settings per run, pass `config=` (see subspace.config.ConfigOverlay)
+    to Runner.factory instead.
+    """
     if not settings:
         settings = {}
 
     import ansible.constants
-    import ansible.plugins
-    import ansible.executor.task_queue_manager
-    reload(ansible.constants)
-    reload(ansible.constants)
-    reload(ansible.executor.task_queue_manager)
+    if reload_config:
+        import importlib
+        # Python 2 only has the builtin reload
+        reload_module = getattr(importlib, 'reload', None) or reload
+        reload_module(ansible.constants)
 
-    for k,v in settings.iteritems():
+    for k,v in settings.items():
         setattr(ansible.constants, k, v)
@@ -0,0 +1,164 @@
+"""
+Adaptive fork sizing for SubspaceTaskQueueManager.
+
+Ansible sizes the worker pool once per play as min(forks, serial, hosts).
+With `adaptive_forks` enabled the pool is created at an upper bound and an
+AdaptiveForks controller decides, while the play runs, how many workers may
+be busy at the same time:
+
+* Tasks waiting for a free worker while the controller is healthy raise the
+  limit (additive increase, doubled while results are slow to come back,
+  because slow hosts keep workers busy without using controller CPU).
+* A controller process using more than `max_cpu` of a core, or a backlog of
+  more than `max_backlog` unprocessed results, lowers the limit
+  (multiplicative decrease).
+
+The limit always stays within [min_forks, max_forks].
+"""
+import os
+import time
+
+
+__all__ = ['AdaptiveForks']
+
+
+class AdaptiveForks(object):
+    """
+    :min_forks: / :max_forks: Bounds for the number of busy workers.
+    :initial_forks: Starting limit (default: the configured forks).
+    :interval: Minimum seconds between two adjustments.
+    :max_cpu: Controller CPU utilization (0.0 - 1.0 of one core) above which
+              the limit is lowered.
+    :max_backlog: Unprocessed results above which the limit is lowered
+                  (default: the current limit).
+    :slow_latency: Mean seconds from queueing a task to its result above
+                   which the increase step is doubled.
+    :step: Workers added per increase.
+    :decrease: Factor applied to the limit on decrease.
+    """
+
+    def __init__(self, min_forks=1, max_forks=None, initial_forks=None,
+                 interval=1.0, max_cpu=0.9, max_backlog=None,
+                 slow_latency=5.0, step=None, decrease=0.75):
+        self.min_forks = max(int(min_forks), 1)
+        self.max_forks = max_forks
+        self.initial_forks = initial_forks
+        self.interval = interval
+        self.max_cpu = max_cpu
+        self.max_backlog = max_backlog
+        self.slow_latency = slow_latency
+        self.step = step
+        self.decrease = decrease
+        self.forks = initial_forks or self.min_forks
+        self.adjustments = 0
+        self._queued_at = {}
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._backlog = 0
+        self._waited = False
+        self._last_adjust = None
+        self._last_cpu = None
+
+    @classmethod
+    def from_option(cls, value, forks):
+        """
+        Build a controller from RunnerOptions.adaptive_forks:
+        True (bounds derived from `forks`), a dict of keyword args or an
+        AdaptiveForks instance used as a template.
+        """
+        if isinstance(value, AdaptiveForks):
+            settings = value.settings()
+        elif isinstance(value, dict):
+            settings = dict(value)
+        else:
+            settings = {}
+        settings.setdefault('min_forks', max(forks // 4, 1))
+        settings.setdefault('max_forks', forks * 4)
+        settings.setdefault('initial_forks', forks)
+        return cls(**settings)
+
+    def settings(self):
+        return dict(min_forks=self.min_forks, max_forks=self.max_forks,
+                    initial_forks=self.initial_forks, interval=self.interval,
+                    max_cpu=self.max_cpu, max_backlog=self.max_backlog,
+                    slow_latency=self.slow_latency, step=self.step,
+                    decrease=self.decrease)
+
+    def start(self, pool_size):
+        """
+        Reset for a new play whose worker pool holds `pool_size` workers.
+        """
+        if self.max_forks is None or self.max_forks > pool_size:
+            self.max_forks = pool_size
+        self.min_forks = min(self.min_forks, self.max_forks)
+        self.forks = self._clamp(self.initial_forks or self.max_forks)
+        self._queued_at = {}
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._backlog = 0
+        self._waited = False
+        self._last_adjust = time.time()
+        self._last_cpu = self._cpu_time()
+        return self.forks
+
+    def _clamp(self, forks):
+        return max(self.min_forks, min(self.max_forks, int(forks)))
+
+    @staticmethod
+    def _cpu_time():
+        times = os.times()
+        return times[0] + times[1]
+
+    def task_queued(self, key):
+        self._queued_at[key] = time.time()
+
+    def result_received(self, key):
+        queued_at = self._queued_at.pop(key, None)
+        if queued_at is not None:
+            self._latency_total += time.time() - queued_at
+            self._latency_count += 1
+
+    def slot_waited(self):
+        self._waited = True
+
+    def observe_backlog(self, depth):
+        self._backlog = depth
+
+    @property
+    def mean_latency(self):
+        if not self._latency_count:
+            return 0.0
+        return self._latency_total / self._latency_count
+
+    def maybe_adjust(self):
+        """
+        Re-evaluate the limit if `interval` has passed. Returns the limit.
+        """
+        now = time.time()
+        elapsed = now - self._last_adjust
+        if elapsed < self.interval:
+            return self.forks
+
+        cpu_time = self._cpu_time()
+        cpu = (cpu_time - self._last_cpu) / elapsed if elapsed else 0.0
+        max_backlog = self.max_backlog or self.forks
+
+        if cpu > self.max_cpu or self._backlog > max_backlog:
+            forks = self._clamp(self.forks * self.decrease)
+        elif self._waited:
+            step = self.step or max(self.forks // 10, 1)
+            if self.mean_latency >= self.slow_latency:
+                step *= 2
+            forks = self._clamp(self.forks + step)
+        else:
+            forks = self.forks
+
+        if forks != self.forks:
+            self.adjustments += 1
+            self.forks = forks
+        self._waited = False
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._last_adjust = now
+        self._last_cpu = cpu_time
+        return self.forks
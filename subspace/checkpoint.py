@@ -0,0 +1,111 @@
+"""
+Checkpoints for multi-playbook runs.
+
+When a checkpoint file is given, the PlaybookExecutor records after every
+playbook which hosts completed it successfully, along with their registered
+results (the nonpersistent fact cache, also exposed as Runner.results):
+
+    {"version": 1,
+     "hosts": {"vm64-214.iplantcollaborative.org": {
+         "completed": ["/playbooks/00_check.yml", "/playbooks/10_users.yml"],
+         "results": {"uptime_out": {"rc": 0, "stdout": "..."}}}}}
+
+Running again with resume=True skips each playbook for the hosts that
+completed it and restores their registered results, so later playbooks can
+still use them. Hosts that failed or were unreachable run the playbook again.
+"""
+import json
+import os
+import tempfile
+
+from subspace.exceptions import CheckpointError
+
+
+__all__ = ['Checkpoint']
+
+
+class Checkpoint(object):
+    """
+    :path: File the checkpoint is read from and written to.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.hosts = {}
+
+    def __repr__(self):
+        return "Checkpoint(%r)" % (self.path,)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read the checkpoint at `path`, or start an empty one if there is none.
+        """
+        checkpoint = cls(path)
+        if not os.path.exists(path):
+            return checkpoint
+        try:
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except ValueError as exc:
+            raise CheckpointError("Could not read checkpoint %s: %s" % (path, exc))
+        if data.get('version') != cls.VERSION:
+            raise CheckpointError(
+                "Checkpoint %s has version %s, expected %s"
+                % (path, data.get('version'), cls.VERSION))
+        checkpoint.hosts = data.get('hosts', {})
+        return checkpoint
+
+    @staticmethod
+    def _playbook_key(playbook_path):
+        return os.path.realpath(playbook_path)
+
+    def _host(self, host_name):
+        return self.hosts.setdefault(host_name, {'completed': [], 'results': {}})
+
+    def is_completed(self, host_name, playbook_path):
+        host = self.hosts.get(host_name)
+        return bool(host) and self._playbook_key(playbook_path) in host['completed']
+
+    def completed_hosts(self, playbook_path, host_names):
+        """
+        Return the subset of `host_names` that completed `playbook_path`.
+        """
+        return [name for name in host_names if self.is_completed(name, playbook_path)]
+
+    def mark_completed(self, host_name, playbook_path, results=None):
+        host = self._host(host_name)
+        playbook_key = self._playbook_key(playbook_path)
+        if playbook_key not in host['completed']:
+            host['completed'].append(playbook_key)
+        if results is not None:
+            host['results'] = results
+
+    def results(self, host_name):
+        host = self.hosts.get(host_name)
+        return host['results'] if host else {}
+
+    def save(self):
+        """
+        Atomically write the checkpoint, so a crash never leaves a partial file.
+        """
+        data = {'version': self.VERSION, 'hosts': self.hosts}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'w') as checkpoint_file:
+                json.dump(data, checkpoint_file, separators=(',', ':'), default=_to_json)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+def _to_json(value):
+    # Registered results may hold sets, bytes or Ansible objects
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
@@ -0,0 +1,97 @@
+"""
+Per-run Ansible configuration overlays.
+
+A ConfigOverlay holds a set of `ansible.constants` values that are applied
+for the duration of a single run and reverted afterwards:
+
+    overlay = ConfigOverlay({"HOST_KEY_CHECKING": False,
+                             "DEFAULT_ROLES_PATH": "/opt/any/roles/path"})
+    Runner.factory(host_file, playbook_dir, logger, config=overlay)
+
+Applying and reverting is a handful of setattr calls, no module is reloaded.
+Worker processes forked while an overlay is applied inherit its values,
+and an overlay pickles as its settings, so it can be shipped to other
+processes. `ansible.constants` is process-global, so overlays applied from
+different threads are serialized instead of racing on it. An empty overlay
+takes the lock as well: a run without settings of its own must not see the
+constants another thread's overlay applied halfway through it.
+"""
+import threading
+
+
+__all__ = ['ConfigOverlay']
+
+
+_MISSING = object()
+
+
+class ConfigOverlay(object):
+    """
+    :settings: dict of ansible.constants names to values.
+    """
+    # Held while any overlay, empty or not, is applied, re-entrant so that
+    # overlays can be nested (applied and reverted in LIFO order) within
+    # one thread.
+    _lock = threading.RLock()
+
+    def __init__(self, settings=None):
+        self.settings = dict(settings or {})
+        self._saved = None
+
+    def __repr__(self):
+        return "ConfigOverlay(%r)" % (self.settings,)
+
+    def __reduce__(self):
+        return (ConfigOverlay, (self.settings,))
+
+    def __enter__(self):
+        self.apply()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.revert()
+        return False
+
+    @property
+    def applied(self):
+        return self._saved is not None
+
+    def as_dict(self):
+        return dict(self.settings)
+
+    def merged(self, settings):
+        """
+        Return a new overlay with `settings` layered over this one.
+        """
+        combined = dict(self.settings)
+        combined.update(settings or {})
+        return ConfigOverlay(combined)
+
+    def apply(self):
+        if self.applied:
+            raise RuntimeError("%r is already applied" % self)
+
+        import ansible.constants
+        self._lock.acquire()
+        saved = {}
+        for name, value in self.settings.items():
+            saved[name] = getattr(ansible.constants, name, _MISSING)
+            setattr(ansible.constants, name, value)
+        self._saved = saved
+        return self
+
+    def revert(self):
+        if not self.applied:
+            return self
+
+        import ansible.constants
+        try:
+            for name, value in self._saved.items():
+                if value is _MISSING:
+                    delattr(ansible.constants, name)
+                else:
+                    setattr(ansible.constants, name, value)
+        finally:
+            self._saved = None
+            self._lock.release()
+        return self
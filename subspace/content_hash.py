@@ -0,0 +1,172 @@
+"""
+Skip playbooks whose inputs did not change since a clean run.
+
+With `skip_unchanged=` the PlaybookExecutor hashes, per host, everything a
+playbook run depends on:
+
+* the playbook file, the files of the roles it uses (with dependencies) and
+  the other, non-playbook, files in its directory (includes, vars files,
+  templates, ...),
+* the extra vars and the host's inventory (host and group) vars,
+* the host name,
+* the task selection of the run (tags, skip_tags, start_at_task), so a
+  run of part of a playbook never stands for a run of all of it.
+
+When a host completes a playbook with no failures and no changes, the hash is
+recorded in a local JSON file. A later run skips the playbook for every host
+whose hash matches the recorded one, and reports it in
+SubspaceAggregateStats.skipped_unchanged. Any failure or change on a host
+drops its record, so the playbook runs again next time.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+__all__ = ['ContentHashStore', 'playbook_digest', 'source_digest', 'role_paths', 'host_digest',
+           'task_selection']
+
+DEFAULT_PATH = os.path.join('~', '.subspace', 'unchanged.json')
+
+
+def _hash_file(digest, path):
+    digest.update(path.encode('utf-8'))
+    with open(path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(65536), b''):
+            digest.update(chunk)
+
+
+def _hash_tree(digest, root, exclude=()):
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.startswith('.') or name.endswith('.retry') or path in exclude:
+                continue
+            _hash_file(digest, path)
+
+
+def role_paths(plays):
+    """
+    Paths of the roles `plays` use, with their dependencies.
+    """
+    paths = set()
+    for play in plays:
+        for role in play.get_roles():
+            paths.add(role._role_path)
+            for dependency in role.get_all_dependencies():
+                paths.add(dependency._role_path)
+    return sorted(paths)
+
+
+def source_digest(playbook_path, role_paths):
+    """
+    Hash a playbook file, the other files in its directory and the trees
+    of `role_paths`. Other playbooks next to it are left out, so that
+    editing one playbook does not invalidate the others.
+    """
+    digest = hashlib.sha256()
+    playbook_path = os.path.realpath(playbook_path)
+    playbook_dir = os.path.dirname(playbook_path)
+    _hash_file(digest, playbook_path)
+
+    other_playbooks = set(
+        os.path.join(playbook_dir, name) for name in os.listdir(playbook_dir)
+        if name.endswith('.yml') and os.path.isfile(os.path.join(playbook_dir, name)))
+    _hash_tree(digest, playbook_dir, exclude=other_playbooks)
+    for role_path in role_paths:
+        _hash_tree(digest, os.path.realpath(role_path))
+    return digest.hexdigest()
+
+
+def playbook_digest(playbook_path, playbook):
+    """
+    Hash the content `playbook` (loaded from `playbook_path`) depends on.
+    """
+    return source_digest(playbook_path, role_paths(playbook.get_plays()))
+
+
+def task_selection(options):
+    """
+    The options of a run that select the tasks it runs, or None if it runs
+    all of them.
+    """
+    selection = {}
+    tags = sorted(set(getattr(options, 'tags', None) or []) - set(['all']))
+    if tags:
+        selection['tags'] = tags
+    skip_tags = sorted(getattr(options, 'skip_tags', None) or [])
+    if skip_tags:
+        selection['skip_tags'] = skip_tags
+    start_at_task = getattr(options, 'start_at_task', None)
+    if start_at_task:
+        selection['start_at_task'] = start_at_task
+    return selection or None
+
+
+def host_digest(content_digest, host_name, variables, selection=None):
+    """
+    Combine a playbook_digest with the host name, its `variables` and the
+    task_selection of the run.
+    """
+    digest = hashlib.sha256()
+    digest.update(content_digest.encode('utf-8'))
+    digest.update(host_name.encode('utf-8'))
+    digest.update(json.dumps(variables, sort_keys=True, default=str).encode('utf-8'))
+    if selection:
+        digest.update(json.dumps(selection, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ContentHashStore(object):
+    """
+    :path: JSON file holding {host: {playbook: hash}} of clean runs.
+    """
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_PATH)
+        self.hosts = {}
+
+    def __repr__(self):
+        return "ContentHashStore(%r)" % (self.path,)
+
+    @classmethod
+    def load(cls, path=None):
+        store = cls(path)
+        if not os.path.exists(store.path):
+            return store
+        try:
+            with open(store.path) as store_file:
+                data = json.load(store_file)
+        except ValueError:
+            # A damaged record only costs a full run
+            return store
+        if data.get('version') == cls.VERSION:
+            store.hosts = data.get('hosts', {})
+        return store
+
+    def is_unchanged(self, host_name, playbook_path, digest):
+        playbooks = self.hosts.get(host_name, {})
+        return playbooks.get(os.path.realpath(playbook_path)) == digest
+
+    def record(self, host_name, playbook_path, digest):
+        self.hosts.setdefault(host_name, {})[os.path.realpath(playbook_path)] = digest
+
+    def forget(self, host_name, playbook_path):
+        self.hosts.get(host_name, {}).pop(os.path.realpath(playbook_path), None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.unchanged-')
+        try:
+            with os.fdopen(fd, 'w') as store_file:
+                json.dump({'version': self.VERSION, 'hosts': self.hosts},
+                          store_file, separators=(',', ':'))
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
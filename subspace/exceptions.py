@@ -10,3 +10,17 @@ class NoValidHosts(SubspaceException):
     Thrown when no valid hosts are available
     """
     pass
+
+
+class CheckpointError(SubspaceException):
+    """
+    Thrown when a checkpoint file can not be used to resume a run
+    """
+    pass
+
+
+class ShardError(SubspaceException):
+    """
+    Thrown when a shard of a sharded run could not complete
+    """
+    pass
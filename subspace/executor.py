@@ -1,16 +1,34 @@
+import os
+
 from ansible.executor import playbook_executor
+from ansible.module_utils._text import to_text
+from ansible.playbook import Playbook
 from ansible.utils.ssh_functions import check_for_controlpersist
 from ansible import constants as C
 
+from subspace import profiler
+from subspace.content_hash import host_digest, playbook_digest, task_selection
+from subspace.fast_fail import FastFailPolicy
 from subspace.task_queue_manager import SubspaceTaskQueueManager
+from subspace.template_cache import SubspaceTemplar
+
+try:
+    from __main__ import display
+except ImportError:
+    from ansible.utils.display import Display
+    display = Display()
+
+# Marks that no subset has to be restored after a playbook
+_UNSET = object()
 
 class PlaybookExecutor(playbook_executor.PlaybookExecutor):
     '''
     This is an extension of ansible playbook_excutor.PlaybookExecutor
-    Its sole purpose is to provide the ability to pass a *custom* TaskQueueManager.
+    It passes a *custom* TaskQueueManager and exposes per-playbook hooks to subspace.
     '''
 
-    def __init__(self, playbooks, inventory, variable_manager, loader, options, passwords):
+    def __init__(self, playbooks, inventory, variable_manager, loader, options, passwords, fast_fail=None,
+                 checkpoint=None, resume=False, content_hashes=None):
         self._playbooks        = playbooks
         self._inventory        = inventory
         self._variable_manager = variable_manager
@@ -18,6 +36,13 @@ class PlaybookExecutor(playbook_executor.PlaybookExecutor):
         self._options          = options
         self.passwords         = passwords
         self._unreachable_hosts = dict()
+        self._fast_fail = FastFailPolicy.from_option(fast_fail)
+        self._fast_failed_hosts = dict()
+        self._checkpoint = checkpoint
+        self._resume = resume
+        self._content_hashes = content_hashes
+        self._host_digests = {}
+        self._saved_subset = _UNSET
 
         if options.listhosts or options.listtasks or options.listtags or options.syntax:
             self._tqm = None
@@ -31,3 +56,338 @@ class PlaybookExecutor(playbook_executor.PlaybookExecutor):
         # where it is used (in task_executor) because that is post-fork and
         # therefore would be discarded after every task.
         check_for_controlpersist(C.ANSIBLE_SSH_EXECUTABLE)
+
+    def run(self):
+
+        '''
+        Run the given playbook, based on the settings in the play which
+        may limit the runs to serialized groups, etc.
+        '''
+
+        result = 0
+        entrylist = []
+        entry = {}
+        # Subspace: result of the playbooks whose failed hosts were pruned
+        pruned_result = 0
+        try:
+            if self._fast_fail is not None and self._tqm is not None:
+                num_hosts = len(self._inventory.get_hosts())
+            self._restore_checkpoint()
+            for playbook_path in self._playbooks:
+                if not self._start_playbook(playbook_path):
+                    continue
+                pb = self._load_playbook(playbook_path)
+                if not self._skip_unchanged(playbook_path, pb):
+                    self._finish_playbook(playbook_path)
+                    continue
+                self._inventory.set_playbook_basedir(os.path.realpath(os.path.dirname(playbook_path)))
+
+                if self._tqm is None:  # we are doing a listing
+                    entry = {'playbook': playbook_path}
+                    entry['plays'] = []
+                else:
+                    # make sure the tqm has callbacks loaded
+                    self._tqm.load_callbacks()
+                    self._tqm.send_callback('v2_playbook_on_start', pb)
+
+                i = 1
+                plays = pb.get_plays()
+                display.vv(u'%d plays in %s' % (len(plays), to_text(playbook_path)))
+
+                for play in plays:
+                    if play._included_path is not None:
+                        self._loader.set_basedir(play._included_path)
+                    else:
+                        self._loader.set_basedir(pb._basedir)
+
+                    # clear any filters which may have been applied to the inventory
+                    self._inventory.remove_restriction()
+
+                    if play.vars_prompt:
+                        for var in play.vars_prompt:
+                            vname     = var['name']
+                            prompt    = var.get("prompt", vname)
+                            default   = var.get("default", None)
+                            private   = var.get("private", True)
+                            confirm   = var.get("confirm", False)
+                            encrypt   = var.get("encrypt", None)
+                            salt_size = var.get("salt_size", None)
+                            salt      = var.get("salt", None)
+
+                            if vname not in self._variable_manager.extra_vars:
+                                if self._tqm:
+                                    self._tqm.send_callback('v2_playbook_on_vars_prompt', vname, private, prompt, encrypt, confirm, salt_size, salt, default)
+                                    play.vars[vname] = display.do_var_prompt(vname, private, prompt, encrypt, confirm, salt_size, salt, default)
+                                else:  # we are either in --list-<option> or syntax check
+                                    play.vars[vname] = default
+
+                    # Create a temporary copy of the play here, so we can run post_validate
+                    # on it without the templating changes affecting the original object.
+                    all_vars = self._variable_manager.get_vars(loader=self._loader, play=play)
+                    templar = SubspaceTemplar(loader=self._loader, variables=all_vars)
+                    new_play = play.copy()
+                    new_play.post_validate(templar)
+
+                    if self._options.syntax:
+                        continue
+
+                    if self._tqm is None:
+                        # we are just doing a listing
+                        entry['plays'].append(new_play)
+
+                    else:
+                        self._tqm._unreachable_hosts.update(self._unreachable_hosts)
+
+                        previously_failed = len(self._tqm._failed_hosts)
+                        previously_unreachable = len(self._tqm._unreachable_hosts)
+
+                        break_play = False
+                        # we are actually running plays
+                        batches = self._get_serialized_batches(new_play)
+                        if len(batches) == 0:
+                            self._tqm.send_callback('v2_playbook_on_play_start', new_play)
+                            self._tqm.send_callback('v2_playbook_on_no_hosts_matched')
+                        for batch in batches:
+                            # restrict the inventory to the hosts in the serialized batch
+                            self._inventory.restrict_to_hosts(batch)
+                            # and run it...
+                            result = self._tqm.run(play=play)
+
+                            # break the play if the result equals the special return code
+                            if result & self._tqm.RUN_FAILED_BREAK_PLAY != 0:
+                                result = self._tqm.RUN_FAILED_HOSTS
+                                break_play = True
+
+                            # check the number of failures here, to see if they're above the maximum
+                            # failure percentage allowed, or if any errors are fatal. If either of those
+                            # conditions are met, we break out, otherwise we only break out if the entire
+                            # batch failed
+                            failed_hosts_count = len(self._tqm._failed_hosts) + len(self._tqm._unreachable_hosts) - \
+                                (previously_failed + previously_unreachable)
+
+                            if len(batch) == failed_hosts_count:
+                                break_play = True
+                                break
+
+                            # update the previous counts so they don't accumulate incorrectly
+                            # over multiple serial batches
+                            previously_failed += len(self._tqm._failed_hosts) - previously_failed
+                            previously_unreachable += len(self._tqm._unreachable_hosts) - previously_unreachable
+
+                            # save the unreachable hosts from this batch
+                            self._unreachable_hosts.update(self._tqm._unreachable_hosts)
+
+                        if break_play:
+                            break
+
+                    i = i + 1  # per play
+
+                if entry:
+                    entrylist.append(entry)  # per playbook
+
+                # send the stats callback for this playbook
+                if self._tqm is not None:
+                    if C.RETRY_FILES_ENABLED:
+                        retries = set(self._tqm._failed_hosts.keys())
+                        retries.update(self._tqm._unreachable_hosts.keys())
+                        retries = sorted(retries)
+                        if len(retries) > 0:
+                            if C.RETRY_FILES_SAVE_PATH:
+                                basedir = C.shell_expand(C.RETRY_FILES_SAVE_PATH)
+                            elif playbook_path:
+                                basedir = os.path.dirname(os.path.abspath(playbook_path))
+                            else:
+                                basedir = '~/'
+
+                            (retry_name, _) = os.path.splitext(os.path.basename(playbook_path))
+                            filename = os.path.join(basedir, "%s.retry" % retry_name)
+                            if self._generate_retry_inventory(filename, retries):
+                                display.display("\tto retry, use: --limit @%s\n" % filename)
+
+                    self._tqm.send_callback('v2_playbook_on_stats', self._tqm._stats)
+                    self._finish_playbook(playbook_path)
+
+                # Subspace: let the fast-fail policy decide whether to go on
+                if self._fast_fail is not None and self._tqm is not None:
+                    num_pruned = len(self._fast_failed_hosts)
+                    if self._apply_fast_fail(playbook_path, num_hosts):
+                        break
+                    if result != 0:
+                        # Only the failures of the hosts just pruned are
+                        # left behind, any other error stops the run
+                        if len(self._fast_failed_hosts) == num_pruned:
+                            break
+                        pruned_result |= result
+                        result = 0
+                # if the last result wasn't zero, break out of the playbook file name loop
+                elif result != 0:
+                    break
+
+            result = result or pruned_result
+
+            if entrylist:
+                return entrylist
+
+        finally:
+            if self._tqm is not None:
+                self._tqm.cleanup()
+            if self._loader:
+                self._loader.cleanup_all_tmp_files()
+
+        if self._options.syntax:
+            display.display("No issues encountered")
+            return result
+
+        return result
+
+    def _load_playbook(self, playbook_path):
+        with profiler.phase('playbook_load'):
+            pb = Playbook.load(playbook_path, variable_manager=self._variable_manager, loader=self._loader)
+        if self._tqm is not None:
+            for play in pb.get_plays():
+                self._tqm._stats.register_play(play, playbook_path)
+        return pb
+
+    def _restore_checkpoint(self):
+        """
+        When resuming, restore the registered results saved in the checkpoint.
+        """
+        if self._checkpoint is None or not self._resume or self._tqm is None:
+            return
+        for host_name in self._checkpoint.hosts:
+            host = self._inventory.get_host(host_name)
+            results = self._checkpoint.results(host_name)
+            if host is not None and results:
+                self._variable_manager.set_nonpersistent_facts(host, results)
+
+    def _start_playbook(self, playbook_path):
+        """
+        When resuming, leave out the hosts that already completed `playbook_path`.
+        Returns False if no host is left to run it on.
+        """
+        if self._checkpoint is None or not self._resume or self._tqm is None:
+            return True
+        # The last play's restriction to its batch is still applied
+        host_names = [host.name for host in self._inventory.get_hosts(ignore_restrictions=True)]
+        completed = self._checkpoint.completed_hosts(playbook_path, host_names)
+        if not completed:
+            return True
+        if len(completed) == len(host_names):
+            display.display("Resume: skipping %s, completed on all %d host(s)" % (playbook_path, len(completed)))
+            return False
+
+        display.display("Resume: skipping %s on %d host(s)" % (playbook_path, len(completed)))
+        self._skip_hosts(completed)
+        return True
+
+    def _skip_unchanged(self, playbook_path, pb):
+        """
+        Leave out the hosts for which nothing `pb` depends on changed since
+        it last ran on them without failures or changes.
+        Returns False if no host is left to run it on.
+        """
+        self._host_digests = {}
+        if self._content_hashes is None or self._tqm is None:
+            return True
+
+        stats = self._tqm._stats
+        content_digest = playbook_digest(playbook_path, pb)
+        selection = task_selection(self._options)
+        unchanged = []
+        # The last play's restriction to its batch is still applied
+        for host in self._inventory.get_hosts(ignore_restrictions=True):
+            variables = dict(self._variable_manager.extra_vars)
+            variables.update(self._inventory.get_vars(host.name))
+            digest = host_digest(content_digest, host.name, variables, selection)
+            if self._content_hashes.is_unchanged(host.name, playbook_path, digest):
+                unchanged.append(host.name)
+                stats.record_unchanged_skip(host.name, playbook_path)
+            else:
+                self._host_digests[host.name] = (digest, stats.changed.get(host.name, 0))
+        if not unchanged:
+            return True
+
+        display.display("Skipping %s on %d unchanged host(s)" % (playbook_path, len(unchanged)))
+        if not self._host_digests:
+            return False
+        self._skip_hosts(unchanged)
+        return True
+
+    def _skip_hosts(self, host_names):
+        # Leave `host_names` out of the current playbook only
+        if self._saved_subset is _UNSET:
+            self._saved_subset = self._inventory._subset
+        subset = list(self._inventory._subset or ['all'])
+        subset.extend('!%s' % name for name in host_names)
+        self._inventory.subset(subset)
+
+    def _finish_playbook(self, playbook_path):
+        """
+        Record the hosts that completed `playbook_path` in the checkpoint, and
+        the hosts that completed it without any change in the content hashes.
+        """
+        if self._saved_subset is not _UNSET:
+            self._inventory._subset = self._saved_subset
+            self._saved_subset = _UNSET
+        if self._checkpoint is None and self._content_hashes is None:
+            return
+
+        failed = self._tqm._failed_hosts
+        unreachable = self._tqm._unreachable_hosts
+        if self._checkpoint is not None:
+            fact_cache = self._variable_manager._nonpersistent_fact_cache
+            for host in self._inventory.get_hosts(ignore_restrictions=True):
+                if host.name in failed or host.name in unreachable:
+                    continue
+                self._checkpoint.mark_completed(host.name, playbook_path, dict(fact_cache.get(host.name, {})))
+            self._checkpoint.save()
+
+        if self._content_hashes is not None and self._host_digests:
+            stats = self._tqm._stats
+            for (host_name, (digest, changed)) in self._host_digests.items():
+                clean = (host_name not in failed and host_name not in unreachable
+                         and stats.changed.get(host_name, 0) == changed)
+                if clean and not self._options.check:
+                    self._content_hashes.record(host_name, playbook_path, digest)
+                else:
+                    self._content_hashes.forget(host_name, playbook_path)
+            self._host_digests = {}
+            self._content_hashes.save()
+
+    def _apply_fast_fail(self, playbook_path, num_hosts):
+        """
+        Apply the fast-fail policy after `playbook_path` has run: record newly
+        failed/unreachable hosts in the stats and prune them from the subset.
+        Returns True if the run should stop.
+        """
+        failed = self._tqm._failed_hosts
+        unreachable = self._tqm._unreachable_hosts
+        doomed = dict((name, 'failed') for name in failed)
+        doomed.update((name, 'unreachable') for name in unreachable)
+        new_hosts = sorted(name for name in doomed if name not in self._fast_failed_hosts)
+
+        abort = self._fast_fail.should_abort(num_hosts, failed, unreachable)
+        if not abort and not new_hosts:
+            return False
+        if not abort and not self._fast_fail.prune:
+            abort = "%d host(s) failed" % len(new_hosts)
+
+        action = FastFailPolicy.ABORTED if abort else FastFailPolicy.PRUNED
+        for name in new_hosts:
+            self._fast_failed_hosts[name] = doomed[name]
+            self._tqm._stats.record_fast_fail(name, doomed[name], playbook_path, action)
+
+        if abort:
+            display.warning("Fast-fail: aborting the run after %s: %s" % (playbook_path, abort))
+            return True
+
+        display.warning("Fast-fail: removing %d host(s) after %s: %s" % (
+            len(new_hosts), playbook_path, ', '.join(new_hosts)))
+        subset = list(self._inventory._subset or ['all'])
+        subset.extend('!%s' % name for name in new_hosts)
+        self._inventory.subset(subset)
+        # The last play's restriction to its batch is still applied
+        if not self._inventory.get_hosts(ignore_restrictions=True):
+            display.warning("Fast-fail: no hosts left to run the remaining playbooks on")
+            return True
+        return False
@@ -0,0 +1,70 @@
+"""
+Fast-fail policy for runs spanning several playbooks.
+
+Ansible stops a run after the first playbook with a failed or unreachable
+host. With a FastFailPolicy, the PlaybookExecutor instead decides after
+every playbook:
+
+* abort the run, if the hosts that failed or went unreachable so far exceed
+  one of the thresholds (`max_fail_percentage`, `any_unreachable`), or
+* prune those hosts from the inventory subset (`prune=True`), so the
+  remaining playbooks only run, and pay play setup, for healthy hosts.
+
+Each affected host is recorded in SubspaceAggregateStats.fast_fail with its
+reason ('failed' or 'unreachable'), the playbook and the action taken.
+"""
+
+
+__all__ = ['FastFailPolicy']
+
+
+class FastFailPolicy(object):
+    """
+    :max_fail_percentage: Abort once more than this percentage of the hosts
+                          in the run failed or went unreachable.
+    :any_unreachable: Abort as soon as any host is unreachable.
+    :prune: Below the thresholds, drop failed/unreachable hosts from the
+            subset and keep running the remaining playbooks. If False,
+            stop after the first playbook with failures, as Ansible does.
+    """
+    PRUNED = 'pruned'
+    ABORTED = 'aborted'
+
+    def __init__(self, max_fail_percentage=None, any_unreachable=False, prune=True):
+        self.max_fail_percentage = max_fail_percentage
+        self.any_unreachable = any_unreachable
+        self.prune = prune
+
+    def __repr__(self):
+        return "FastFailPolicy(max_fail_percentage=%r, any_unreachable=%r, prune=%r)" % (
+            self.max_fail_percentage, self.any_unreachable, self.prune)
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a policy from the `fast_fail` option: None/False (disabled),
+        True (defaults), a dict of keyword args or a FastFailPolicy.
+        """
+        if not value:
+            return None
+        if isinstance(value, FastFailPolicy):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls()
+
+    def should_abort(self, num_hosts, failed, unreachable):
+        """
+        Given the number of hosts in the run and the collections of failed
+        and unreachable host names so far, return a message if the run
+        should be aborted or None to continue.
+        """
+        if self.any_unreachable and unreachable:
+            return "%d host(s) unreachable" % len(unreachable)
+        if self.max_fail_percentage is not None and num_hosts:
+            doomed = len(set(failed) | set(unreachable))
+            percentage = 100.0 * doomed / num_hosts
+            if percentage > self.max_fail_percentage:
+                return "%.1f%% of hosts failed (max %s%%)" % (
+                    percentage, self.max_fail_percentage)
+        return None
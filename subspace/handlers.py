@@ -0,0 +1,105 @@
+"""
+Notified-handler bookkeeping for the subspace strategies.
+
+Ansible keeps, per handler UUID, a list of the hosts that notified it and
+checks `host not in list` for every notifying result, which is O(hosts).
+NotifiedHandlers stores NotifiedHosts instead: an insertion-ordered set, so
+membership checks are O(1) while handlers still run on hosts in the order
+they were notified. Lists assigned by Ansible (ex: the wipe after a handler
+run) are converted on the way in.
+
+HandlerIndex holds, per play, what the strategy looks up for every notify:
+handlers by UUID, the handlers with an include in their parent chain (the
+only ones parent_handler_match can match), and the resolved notify names.
+"""
+from ansible.playbook.role_include import IncludeRole
+from ansible.playbook.task_include import TaskInclude
+
+
+__all__ = ['NotifiedHosts', 'NotifiedHandlers', 'HandlerIndex']
+
+
+class NotifiedHosts(object):
+    """
+    Insertion-ordered set of hosts, with the list methods Ansible uses.
+    """
+
+    def __init__(self, hosts=()):
+        self._hosts = []
+        self._members = set()
+        for host in hosts:
+            self.append(host)
+
+    def __repr__(self):
+        return "NotifiedHosts(%r)" % (self._hosts,)
+
+    def __contains__(self, host):
+        return host in self._members
+
+    def __iter__(self):
+        return iter(self._hosts)
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def __getitem__(self, index):
+        return self._hosts[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def append(self, host):
+        if host not in self._members:
+            self._members.add(host)
+            self._hosts.append(host)
+
+
+class NotifiedHandlers(dict):
+    """
+    Handler UUID -> NotifiedHosts.
+    """
+
+    def __setitem__(self, handler_uuid, hosts):
+        if not isinstance(hosts, NotifiedHosts):
+            hosts = NotifiedHosts(hosts)
+        super(NotifiedHandlers, self).__setitem__(handler_uuid, hosts)
+
+
+def _has_include_parent(handler):
+    parent = handler
+    while parent:
+        if isinstance(parent, (TaskInclude, IncludeRole)):
+            return True
+        parent = parent._parent
+    return False
+
+
+class HandlerIndex(object):
+    """
+    Lookups over the handler blocks of a play. Handler blocks are only ever
+    appended to (by included handler files), so the index is rebuilt when
+    their number changes, see `is_current`.
+    """
+
+    def __init__(self, play):
+        self.play_uuid = play._uuid
+        self.num_blocks = len(play.handlers)
+        self.by_uuid = {}
+        self.include_parented = []
+        for handler_block in play.handlers:
+            for handler_task in handler_block.block:
+                if handler_task._uuid in self.by_uuid:
+                    continue
+                self.by_uuid[handler_task._uuid] = handler_task
+                if _has_include_parent(handler_task):
+                    self.include_parented.append(handler_task)
+        # notify name -> handler task (or None), found by name
+        self.by_name = {}
+        # notify name -> handler tasks matched through an include parent
+        self.by_parent_name = {}
+
+    def is_current(self, play):
+        return self.play_uuid == play._uuid and self.num_blocks == len(play.handlers)
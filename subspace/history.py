@@ -0,0 +1,221 @@
+"""
+Local history of runs, for spotting playbooks and roles that got slower.
+
+With `history=` (True for ~/.subspace/history.sqlite, or a path) every
+PlaybookShell.run() ends by recording into an SQLite database:
+
+* the run: start and end time, return code, user, subset, playbooks, hosts,
+* per host and (playbook, play, role, task): the last status, how many
+  results it returned and the seconds from queueing it to its final result
+  (see SubspaceAggregateStats.durations).
+
+The store answers the questions asked after the fact:
+
+    history = RunHistory()
+    history.slowest_tasks(last_runs=20)      # mean seconds per host, slowest first
+    history.regressions(baseline_runs=10)    # latest run vs the 10 before it
+"""
+import json
+import os
+import sqlite3
+import time
+
+
+__all__ = ['RunHistory']
+
+
+DEFAULT_PATH = os.path.join('~', '.subspace', 'history.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    rc INTEGER,
+    username TEXT,
+    subset TEXT,
+    playbooks TEXT,
+    hosts INTEGER
+);
+CREATE TABLE IF NOT EXISTS task_results (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    playbook TEXT NOT NULL,
+    play TEXT NOT NULL,
+    role TEXT NOT NULL,
+    task TEXT NOT NULL,
+    status TEXT,
+    results INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS task_results_run ON task_results (run_id);
+CREATE INDEX IF NOT EXISTS task_results_task ON task_results (playbook, role, task, run_id);
+CREATE INDEX IF NOT EXISTS task_results_host ON task_results (host, run_id);
+"""
+
+TASK_COLUMNS = ('playbook', 'play', 'role', 'task')
+
+
+def _key_values(tuple_key):
+    # ('Path: /x.yml', 'Playbook: name', 'Role: r', 'Task: t') -> values
+    return tuple(part.split(': ', 1)[-1] for part in tuple_key)
+
+
+class RunHistory(object):
+    """
+    :path: SQLite database file, created on first use.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_PATH)
+        self._initialized = False
+
+    def __repr__(self):
+        return "RunHistory(%r)" % (self.path,)
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a store from the `history` option: None/False (disabled), True
+        (default path), a path or a RunHistory.
+        """
+        if not value:
+            return None
+        if isinstance(value, RunHistory):
+            return value
+        if value is True:
+            return cls()
+        return cls(value)
+
+    def _connect(self):
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        if not self._initialized:
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def record_run(self, stats, rc, started, finished=None, username=None,
+                   subset=None, playbooks=None):
+        """
+        Store a finished run and the task durations in its `stats`.
+        Returns the id of the new run.
+        """
+        if finished is None:
+            finished = time.time()
+        if subset is not None and not isinstance(subset, (type(''), type(u''))):
+            subset = ','.join(subset)
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO runs (started, finished, rc, username, subset, playbooks, hosts)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (started, finished, rc, username, subset,
+                     json.dumps(list(playbooks or [])), len(stats.processed)))
+                run_id = cursor.lastrowid
+                rows = []
+                for (host, host_dict) in stats.durations.items():
+                    for (tuple_key, duration_dict) in host_dict.items():
+                        rows.append((run_id, host) + _key_values(tuple_key) + (
+                            duration_dict['status'], duration_dict['count'], duration_dict['seconds']))
+                connection.executemany(
+                    "INSERT INTO task_results (run_id, host, playbook, play, role, task, status, results, seconds)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            connection.close()
+        return run_id
+
+    def runs(self, limit=20):
+        """
+        Return the latest `limit` runs, newest first.
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            connection.close()
+        runs = []
+        for row in rows:
+            run = dict(zip(row.keys(), tuple(row)))
+            run['playbooks'] = json.loads(run['playbooks'] or '[]')
+            runs.append(run)
+        return runs
+
+    def _task_means(self, connection, run_ids):
+        # (playbook, play, role, task) -> (mean seconds per host, hosts, max seconds)
+        if not run_ids:
+            return {}
+        rows = connection.execute(
+            "SELECT playbook, play, role, task, AVG(seconds) AS mean, COUNT(*) AS samples,"
+            " MAX(seconds) AS longest FROM task_results WHERE run_id IN (%s)"
+            " GROUP BY playbook, play, role, task" % ','.join('?' * len(run_ids)),
+            run_ids).fetchall()
+        return dict((tuple(row[column] for column in TASK_COLUMNS),
+                     (row['mean'], row['samples'], row['longest']))
+                    for row in rows)
+
+    def _run_ids(self, connection, limit, before=None):
+        if before is None:
+            rows = connection.execute(
+                "SELECT id FROM runs ORDER BY id DESC LIMIT ?", (limit,))
+        else:
+            rows = connection.execute(
+                "SELECT id FROM runs WHERE id < ? ORDER BY id DESC LIMIT ?", (before, limit))
+        return [row['id'] for row in rows]
+
+    def slowest_tasks(self, last_runs=10, limit=20):
+        """
+        The `limit` tasks with the highest mean duration per host over the
+        last `last_runs` runs, slowest first.
+        """
+        connection = self._connect()
+        try:
+            means = self._task_means(connection, self._run_ids(connection, last_runs))
+        finally:
+            connection.close()
+        slowest = sorted(means.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [dict(zip(TASK_COLUMNS, task_key), mean_seconds=mean, samples=samples, max_seconds=longest)
+                for (task_key, (mean, samples, longest)) in slowest]
+
+    def regressions(self, run_id=None, baseline_runs=10, threshold=1.5, min_seconds=1.0):
+        """
+        Tasks of run `run_id` (default: the latest) whose mean duration per
+        host is at least `threshold` times, and `min_seconds` more than, their
+        mean over the `baseline_runs` runs before it. Worst ratio first.
+        """
+        connection = self._connect()
+        try:
+            if run_id is None:
+                latest = self._run_ids(connection, 1)
+                if not latest:
+                    return []
+                run_id = latest[0]
+            current = self._task_means(connection, [run_id])
+            baseline = self._task_means(connection, self._run_ids(connection, baseline_runs, before=run_id))
+        finally:
+            connection.close()
+
+        regressions = []
+        for (task_key, (mean, samples, longest)) in current.items():
+            if task_key not in baseline:
+                continue
+            baseline_mean = baseline[task_key][0]
+            if mean - baseline_mean < min_seconds:
+                continue
+            if baseline_mean and mean < baseline_mean * threshold:
+                continue
+            regressions.append(dict(
+                zip(TASK_COLUMNS, task_key), run_id=run_id,
+                mean_seconds=mean, baseline_seconds=baseline_mean,
+                ratio=mean / baseline_mean if baseline_mean else None))
+        # No baseline time at all ranks first
+        regressions.sort(key=lambda row: (row['ratio'] is None, row['ratio'] or 0), reverse=True)
+        return regressions
@@ -0,0 +1,161 @@
+"""
+In-memory inventory.
+
+Runner normally takes the path of a hosts file, which Ansible parses on every
+run. A service that already holds its hosts in memory can pass them as an
+InventoryData (or a dict of its keyword args) instead:
+
+    inventory = InventoryData(
+        hosts={'vm-001': {'ansible_host': '10.0.0.1'}, 'vm-002': {}},
+        groups={'compute': {'hosts': ['vm-001', 'vm-002'], 'vars': {'gpu': False}},
+                'atmosphere': {'children': ['compute']}},
+        vars={'ansible_user': 'root'})
+    Runner.factory(inventory, playbook_dir, logger).run()
+
+The data is validated once; every run builds fresh Host and Group objects
+from it (runs may change them, ex: `add_host`), without writing or parsing a
+file. Vars plugins and group_vars/host_vars files under `basedir` (if given)
+still apply, as they do for a hosts file.
+"""
+import copy
+import os
+from collections import OrderedDict
+
+from ansible import constants as C
+from ansible.inventory import Inventory
+from ansible.inventory.group import Group
+from ansible.inventory.host import Host
+from ansible.plugins import vars_loader
+from ansible.utils.vars import combine_vars
+
+
+__all__ = ['InventoryData', 'SubspaceInventory']
+
+
+GROUP_KEYS = ('hosts', 'vars', 'children')
+
+
+class InventoryData(object):
+    """
+    :hosts: dict of host name to its vars, or a list of host names.
+    :groups: dict of group name to a dict with 'hosts' (names), 'vars' and
+             'children' (group names), or to a list of host names.
+    :vars: vars of the 'all' group.
+    :basedir: directory to read group_vars/ and host_vars/ from, as the
+              directory of a hosts file would be.
+    """
+
+    def __init__(self, hosts=None, groups=None, vars=None, basedir=None):
+        self.hosts = OrderedDict()
+        if isinstance(hosts, dict):
+            for (name, host_vars) in hosts.items():
+                self.hosts[name] = dict(host_vars or {})
+        else:
+            for name in hosts or []:
+                self.hosts[name] = {}
+
+        self.groups = OrderedDict()
+        for (name, group_data) in (groups or {}).items():
+            if not isinstance(group_data, dict):
+                group_data = {'hosts': list(group_data or [])}
+            unknown = set(group_data) - set(GROUP_KEYS)
+            if unknown:
+                raise ValueError("Unknown keys for group %s: %s" % (name, ', '.join(sorted(unknown))))
+            self.groups[name] = {
+                'hosts': list(group_data.get('hosts') or []),
+                'vars': dict(group_data.get('vars') or {}),
+                'children': list(group_data.get('children') or []),
+            }
+        # Hosts and child groups may be named without being defined
+        for group_data in list(self.groups.values()):
+            for name in group_data['hosts']:
+                self.hosts.setdefault(name, {})
+            for name in group_data['children']:
+                if name in ('all', 'ungrouped'):
+                    raise ValueError("Group %s can not be a child group" % name)
+                self.groups.setdefault(name, {'hosts': [], 'vars': {}, 'children': []})
+
+        self.vars = dict(vars or {})
+        self.basedir = os.path.abspath(basedir) if basedir else None
+
+    def __repr__(self):
+        return "InventoryData(%d hosts, %d groups)" % (len(self.hosts), len(self.groups))
+
+    def build_groups(self):
+        """
+        Return new Group objects, by name, holding new Host objects.
+        """
+        all_group = Group('all')
+        ungrouped = Group('ungrouped')
+        all_group.add_child_group(ungrouped)
+        groups = {'all': all_group, 'ungrouped': ungrouped}
+        for (key, value) in copy.deepcopy(self.vars).items():
+            all_group.set_variable(key, value)
+
+        for (name, group_data) in self.groups.items():
+            group = groups.setdefault(name, Group(name))
+            for (key, value) in copy.deepcopy(group_data['vars']).items():
+                group.set_variable(key, value)
+        for (name, group_data) in self.groups.items():
+            for child_name in group_data['children']:
+                groups[name].add_child_group(groups[child_name])
+        for group in groups.values():
+            if group is not all_group and not group.parent_groups:
+                all_group.add_child_group(group)
+
+        hosts = {}
+        for (name, host_vars) in self.hosts.items():
+            # The port is set with the other vars: Host(name, port) would
+            # turn a templated port ("{{ ssh_port }}") into an int
+            host = hosts[name] = Host(name)
+            for (key, value) in copy.deepcopy(host_vars).items():
+                host.set_variable(key, value)
+            all_group.add_host(host)
+        for (name, group_data) in self.groups.items():
+            for host_name in group_data['hosts']:
+                groups[name].add_host(hosts[host_name])
+        for host in hosts.values():
+            if host.get_groups() == [all_group]:
+                ungrouped.add_host(host)
+        return groups
+
+
+class SubspaceInventory(Inventory):
+    """
+    Inventory that also accepts an InventoryData as `host_list`.
+    """
+    _inventory_data = None
+
+    def __init__(self, loader, variable_manager, host_list=C.DEFAULT_HOST_LIST):
+        if isinstance(host_list, InventoryData):
+            # Set before Inventory.__init__ calls basedir and parse_inventory
+            self._inventory_data = host_list
+            super(SubspaceInventory, self).__init__(loader, variable_manager, host_list=os.devnull)
+            self.host_list = host_list
+        else:
+            super(SubspaceInventory, self).__init__(loader, variable_manager, host_list=host_list)
+
+    def basedir(self):
+        if self._inventory_data is None:
+            return super(SubspaceInventory, self).basedir()
+        return self._inventory_data.basedir
+
+    def parse_inventory(self, host_list):
+        if self._inventory_data is None:
+            return super(SubspaceInventory, self).parse_inventory(host_list)
+
+        self.parser = None
+        self.groups = self._inventory_data.build_groups()
+        for host in self.groups['all'].get_hosts():
+            if host.name in C.LOCALHOST:
+                self.localhost = host
+        self._vars_plugins = [x for x in vars_loader.all(self)]
+
+        # As Inventory.parse_inventory: add vars from vars plugins and
+        # group_vars/, host_vars/ files
+        for group in self.groups.values():
+            group.vars = combine_vars(group.vars, self.get_group_variables(group.name))
+            self.get_group_vars(group)
+        for host in self.groups['all'].get_hosts():
+            host.vars = combine_vars(host.vars, self.get_host_variables(host.name))
+            self.get_host_vars(host)
@@ -0,0 +1,187 @@
+"""
+Structured listing of playbooks: plays, blocks, tasks, tags and roles.
+
+`Runner.list_playbooks()` returns what --list-tasks, --list-tags and
+--list-hosts print, as data:
+
+    [{'playbook': '/path/to/00_check.yml',
+      'plays': [{'name': 'Check networking',
+                 'hosts': ['all'],
+                 'tags': ['check'],
+                 'task_tags': ['check', 'network'],
+                 'matched_hosts': ['vm-001', ...],   # with hosts=True
+                 'blocks': [{'name': None, 'role': 'check-network',
+                             'tasks': [{'name': 'ping', 'action': 'ping',
+                                        'role': 'check-network',
+                                        'tags': ['check', 'network']},
+                                       {... a nested block, with 'tasks' ...}]}]}]}]
+
+Loading, post-validating and compiling every play is what makes a listing
+slow, so listings are cached per playbook. An entry is valid while the
+playbook, the other files in its directory and the roles it uses hash the
+same (see subspace.content_hash.source_digest) and the listing options
+(tags, skip_tags, extra vars) are the same. Matched hosts depend on the
+inventory and are resolved on every call.
+"""
+import json
+import os
+import tempfile
+import threading
+
+from subspace.content_hash import role_paths, source_digest
+
+
+__all__ = ['ListingCache', 'describe_play', 'default_cache']
+
+
+def _describe_task(task, play_tags):
+    return {
+        'name': task.get_name() if task.name else task.action,
+        'action': task.action,
+        'role': task._role._role_name if task._role else None,
+        'tags': sorted(play_tags.union(task.tags)),
+    }
+
+
+def _describe_block(block, play_tags, all_tags):
+    from ansible.playbook.block import Block
+
+    entries = []
+    for task in block.block:
+        if isinstance(task, Block):
+            nested = _describe_block(task, play_tags, all_tags)
+            if nested['tasks']:
+                entries.append(nested)
+        elif task.action != 'meta':
+            all_tags.update(task.tags)
+            entries.append(_describe_task(task, play_tags))
+    return {
+        'name': block.name or None,
+        'role': block._role._role_name if block._role else None,
+        'tasks': entries,
+    }
+
+
+def describe_play(play, variable_manager, loader, options):
+    """
+    Describe a post-validated `play`: its blocks and tasks (after tag
+    filtering, as --list-tasks shows them), tags and roles.
+    """
+    from subspace.task_queue_manager import SubspacePlayContext
+
+    play_tags = set(play.tags)
+    all_tags = set()
+    blocks = []
+    all_vars = variable_manager.get_vars(loader=loader, play=play)
+    play_context = SubspacePlayContext(play=play, options=options)
+    for block in play.compile():
+        block = block.filter_tagged_tasks(play_context, all_vars)
+        if not block.has_tasks():
+            continue
+        described = _describe_block(block, play_tags, all_tags)
+        # Blocks of meta tasks only (ex: implicit handler flushes) are left out
+        if described['tasks']:
+            blocks.append(described)
+    return {
+        'name': play.name,
+        'hosts': list(play.hosts) if isinstance(play.hosts, list) else [play.hosts],
+        'tags': sorted(play_tags),
+        'task_tags': sorted(play_tags.union(all_tags)),
+        'blocks': blocks,
+    }
+
+
+def options_key(options, extra_vars):
+    """
+    The listing options a cached listing depends on.
+    """
+    return json.dumps([sorted(options.tags or []), sorted(options.skip_tags or []), extra_vars],
+                      sort_keys=True, default=str)
+
+
+class ListingCache(object):
+    """
+    :path: JSON file to keep the cache in between processes (default: memory only).
+    """
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "ListingCache(%r, %d entries)" % (self.path, len(self.entries))
+
+    @classmethod
+    def load(cls, path):
+        cache = cls(path)
+        if not os.path.exists(cache.path):
+            return cache
+        try:
+            with open(cache.path) as cache_file:
+                data = json.load(cache_file)
+        except ValueError:
+            return cache
+        if data.get('version') == cls.VERSION:
+            cache.entries = data.get('entries', {})
+        return cache
+
+    def _key(self, playbook_path, key):
+        return "%s\0%s" % (os.path.realpath(playbook_path), key)
+
+    def get(self, playbook_path, key):
+        """
+        Return the cached plays of `playbook_path` if its content did not
+        change, or None.
+        """
+        with self._lock:
+            entry = self.entries.get(self._key(playbook_path, key))
+        if entry is not None:
+            try:
+                if source_digest(playbook_path, entry['role_paths']) == entry['digest']:
+                    with self._lock:
+                        self.hits += 1
+                    return entry['plays']
+            except (IOError, OSError):
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, playbook_path, key, plays, loaded_plays):
+        """
+        Cache the described `plays`, keyed on the content of the playbook
+        and the roles of its `loaded_plays`.
+        """
+        paths = role_paths(loaded_plays)
+        entry = dict(role_paths=paths, digest=source_digest(playbook_path, paths), plays=plays)
+        with self._lock:
+            self.entries[self._key(playbook_path, key)] = entry
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock:
+            data = {'version': self.VERSION, 'entries': dict(self.entries)}
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.listing-')
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(data, cache_file, separators=(',', ':'))
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+# Shared by every runner of the process unless one passes its own
+default_cache = ListingCache()
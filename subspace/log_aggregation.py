@@ -0,0 +1,77 @@
+"""
+Aggregation of identical per-host results logged by play_logger.
+
+On fleet-wide runs hundreds of hosts often return the same result for a
+task. With `aggregate_logs=` the play_logger callback buffers each result
+line with the host name taken out, and logs every distinct line once, with
+its hosts, when the next task (or handler, play or recap) starts:
+
+    ok: [248 hosts: vm-001, vm-002, ... (+228 more)] - All items completed
+    fatal: [2 hosts: vm-017, vm-113]: FAILED! => {"msg": "..."}
+
+Lines that mention the host name anywhere else stay distinct per host.
+"""
+
+
+__all__ = ['ResultAggregator']
+
+
+class ResultAggregator(object):
+    """
+    :max_hosts: How many host names to list per line before counting.
+    """
+    HOSTS = u'\0hosts\0'
+
+    def __init__(self, max_hosts=20):
+        self.max_hosts = max_hosts
+        self._groups = {}
+        self._order = []
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build an aggregator from the `aggregate_logs` option: None/False
+        (disabled), True (defaults), a dict of keyword args or a
+        ResultAggregator.
+        """
+        if not value:
+            return None
+        if isinstance(value, ResultAggregator):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls()
+
+    def add(self, level, line, host_name):
+        """
+        Buffer a result `line` logged for `host_name` at `level`.
+        """
+        normalized = line.replace(u'[%s' % host_name, u'[' + self.HOSTS, 1)
+        key = (level, normalized)
+        hosts = self._groups.get(key)
+        if hosts is None:
+            hosts = self._groups[key] = []
+            self._order.append(key)
+        hosts.append(host_name)
+
+    def _format_hosts(self, hosts):
+        if len(hosts) == 1:
+            return hosts[0]
+        listed = u', '.join(hosts[:self.max_hosts])
+        if len(hosts) > self.max_hosts:
+            listed += u', ... (+%d more)' % (len(hosts) - self.max_hosts)
+        return u'%d hosts: %s' % (len(hosts), listed)
+
+    def flush(self):
+        """
+        Return the buffered lines as (level, line) pairs, in the order they
+        were first seen, and start over.
+        """
+        lines = []
+        for key in self._order:
+            (level, normalized) = key
+            hosts = self._format_hosts(self._groups[key])
+            lines.append((level, normalized.replace(self.HOSTS, hosts, 1)))
+        self._groups = {}
+        self._order = []
+        return lines
@@ -0,0 +1,111 @@
+"""
+Size limits and sampling for the results play_logger writes.
+
+Results of tasks that print package lists or logs can be megabytes per host.
+With `log_limits=` (True for the defaults below, or a dict of settings) the
+play_logger callback:
+
+* drops `stdout_lines`/`stderr_lines` when `stdout`/`stderr` is present,
+* truncates `stdout`/`stderr` (and other fields in `field_limits`) to their
+  head and tail, and any other string field to `max_field_size`,
+* caps a whole logged ok result at `max_result_size` characters,
+* logs only 1 in `ok_sample_rate` identical ok results of a task.
+
+Failures and unreachable results are never sampled and keep all of their
+fields; they are only capped, at `max_failure_size` characters.
+"""
+
+
+__all__ = ['ResultLimiter']
+
+
+DEFAULT_FIELD_LIMITS = {
+    'stdout': 2048,
+    'stderr': 2048,
+    'msg': 2048,
+}
+DEFAULT_DROP_FIELDS = ('stdout_lines', 'stderr_lines')
+
+
+def truncate(text, limit):
+    """
+    Keep the head and tail of `text` so that it is at most about `limit`
+    characters, noting how much was cut out.
+    """
+    if limit is None or len(text) <= limit:
+        return text
+    half = max(limit // 2, 1)
+    return u"%s\n... [%d characters truncated] ...\n%s" % (
+        text[:half], len(text) - 2 * half, text[-half:])
+
+
+class ResultLimiter(object):
+    """
+    :field_limits: dict of field name to max characters (head and tail kept).
+    :max_field_size: Limit for string fields not in `field_limits`.
+    :max_result_size: Limit for a whole dumped ok result.
+    :max_failure_size: Limit for a whole dumped failed/unreachable result.
+    :ok_sample_rate: Log 1 in N identical ok results of a task (1: all).
+    :drop_fields: Fields removed from ok results when their non-list
+                  counterpart (ex: `stdout` for `stdout_lines`) is present.
+    """
+
+    def __init__(self, field_limits=None, max_field_size=4096,
+                 max_result_size=16384, max_failure_size=65536,
+                 ok_sample_rate=1, drop_fields=DEFAULT_DROP_FIELDS):
+        self.field_limits = dict(DEFAULT_FIELD_LIMITS)
+        self.field_limits.update(field_limits or {})
+        self.max_field_size = max_field_size
+        self.max_result_size = max_result_size
+        self.max_failure_size = max_failure_size
+        self.ok_sample_rate = max(int(ok_sample_rate), 1)
+        self.drop_fields = tuple(drop_fields or ())
+        self._seen = {}
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a limiter from the `log_limits` option: None/False (disabled),
+        True (defaults), a dict of keyword args or a ResultLimiter.
+        """
+        if not value:
+            return None
+        if isinstance(value, ResultLimiter):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls()
+
+    def limit_fields(self, result):
+        """
+        Return a copy of `result` with large fields truncated.
+        """
+        limited = {}
+        for (key, value) in result.items():
+            if key in self.drop_fields and key[:-len('_lines')] in result:
+                continue
+            if isinstance(value, (type(u''), type(''))):
+                value = truncate(value, self.field_limits.get(key, self.max_field_size))
+            limited[key] = value
+        return limited
+
+    def cap(self, dumped, failed=False):
+        """
+        Truncate an already dumped result.
+        """
+        return truncate(dumped, self.max_failure_size if failed else self.max_result_size)
+
+    def sample(self, key):
+        """
+        Count an ok result identified by `key` (ex: task UUID, status and
+        message). Returns how many identical results were seen so far if
+        this one should be logged, or None to leave it out.
+        """
+        count = self._seen.get(key, 0) + 1
+        self._seen[key] = count
+        if (count - 1) % self.ok_sample_rate == 0:
+            return count
+        return None
+
+    def reset(self):
+        self._seen = {}
@@ -0,0 +1,336 @@
+"""
+Optional Prometheus-style instrumentation for subspace.
+
+Metrics are disabled by default. Every instrumentation call checks a single
+module-level flag and returns immediately when metrics are disabled, so the
+runner, strategy and task queue manager pay (almost) nothing for them.
+
+Usage:
+    from subspace import metrics
+
+    metrics.enable()
+    metrics.start_http_server(9111)     # serve http://127.0.0.1:9111/metrics
+    ...
+    metrics.dump('/var/tmp/subspace.prom')  # or write a text file snapshot
+"""
+import os
+import threading
+import time
+
+
+__all__ = ['enable', 'disable', 'is_enabled', 'get_registry',
+           'inc', 'set_gauge', 'observe', 'timer',
+           'render', 'dump', 'start_http_server']
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float('inf'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# HELP text for the metrics emitted by subspace itself.
+DESCRIPTIONS = {
+    'subspace_runner_phase_seconds':
+        'Time spent in each Runner phase.',
+    'subspace_runner_runs_total':
+        'Runner.run invocations by outcome.',
+    'subspace_tqm_workers':
+        'Worker processes initialized for the current play.',
+    'subspace_tqm_effective_forks':
+        'Workers allowed to be busy at once by adaptive forks.',
+    'subspace_tqm_plays_total':
+        'Plays run by the SubspaceTaskQueueManager.',
+    'subspace_strategy_result_queue_depth':
+        'Task results waiting to be processed by the strategy.',
+    'subspace_strategy_result_seconds':
+        'Time spent processing a single task result in the strategy.',
+    'subspace_strategy_results_total':
+        'Task results processed by the strategy, by status.',
+    'subspace_callback_seconds':
+        'Time spent dispatching a callback to every callback plugin.',
+    'subspace_template_cache_total':
+        'Template strings compiled from the template cache (hit), compiled (miss) or left untemplated (literal).',
+}
+
+ENABLED = False
+_registry = None
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels)
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, _escape_label(value)) for key, value in pairs)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    """
+    Base class for a named metric holding one value per label set.
+    """
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation=''):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+
+    def _samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield (self.name, labels, None, value)
+
+    def render(self):
+        lines = []
+        if self.documentation:
+            lines.append('# HELP %s %s' % (self.name, self.documentation))
+        lines.append('# TYPE %s %s' % (self.name, self.metric_type))
+        for name, labels, extra, value in self._samples():
+            lines.append('%s%s %s' % (
+                name, _format_labels(labels, extra), _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, labels, value=1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, labels, value):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation='', buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        """
+        Values are stored as [bucket_counts, sum, count].
+        """
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = [[0] * len(self.buckets), 0.0, 0]
+            self._values[labels] = entry
+        bucket_counts = entry[0]
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                bucket_counts[idx] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def _samples(self):
+        for labels, (bucket_counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield (self.name + '_bucket', labels,
+                       ('le', _format_value(bound)), cumulative)
+            yield (self.name + '_sum', labels, None, total)
+            yield (self.name + '_count', labels, None, count)
+
+
+class MetricsRegistry(object):
+    """
+    Holds every metric created through this module, keyed by name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, documentation='', **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = cls(name, documentation or DESCRIPTIONS.get(name, ''),
+                         **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(
+                "Metric %s is already registered as a %s"
+                % (name, metric.metric_type))
+        return metric
+
+    def inc(self, name, value=1, labels=()):
+        with self._lock:
+            self._get(Counter, name).inc(labels, value)
+
+    def set_gauge(self, name, value, labels=()):
+        with self._lock:
+            self._get(Gauge, name).set(labels, value)
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            self._get(Histogram, name).observe(labels, value)
+
+    def render(self):
+        with self._lock:
+            blocks = [self._metrics[name].render()
+                      for name in sorted(self._metrics)]
+        return '\n'.join(blocks) + '\n' if blocks else ''
+
+
+class _NullTimer(object):
+    """
+    Returned by `timer` while metrics are disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if ENABLED:
+            _registry.observe(self.name, time.time() - self.start, self.labels)
+        return False
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def enable(registry=None):
+    """
+    Turn instrumentation on, optionally with a pre-populated registry.
+    """
+    global ENABLED, _registry
+    if registry is None:
+        registry = _registry or MetricsRegistry()
+    _registry = registry
+    ENABLED = True
+    return _registry
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def is_enabled():
+    return ENABLED
+
+
+def get_registry():
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    _registry.inc(name, value, _labels(labels))
+
+
+def set_gauge(name, value, **labels):
+    if not ENABLED:
+        return
+    _registry.set_gauge(name, value, _labels(labels))
+
+
+def observe(name, value, **labels):
+    if not ENABLED:
+        return
+    _registry.observe(name, value, _labels(labels))
+
+
+def timer(name, **labels):
+    """
+    Context manager observing the elapsed seconds into histogram `name`.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, _labels(labels))
+
+
+def render():
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    if _registry is None:
+        return ''
+    return _registry.render()
+
+
+def dump(path):
+    """
+    Write the current metrics to `path`, replacing it atomically so
+    a node_exporter textfile collector never reads a partial file.
+    """
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as the_file:
+        the_file.write(render())
+    os.rename(tmp_path, path)
+    return path
+
+
+def start_http_server(port, addr='127.0.0.1'):
+    """
+    Serve /metrics from a daemon thread. Returns the HTTPServer so
+    callers can `shutdown()` it.
+    """
+    # Imported here: the HTTP stack is only needed when serving.
+    try:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are frequent, keep them out of stderr.
+            pass
+
+    server = HTTPServer((addr, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='subspace-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
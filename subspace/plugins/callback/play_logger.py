@@ -7,6 +7,9 @@ from ansible.plugins.callback import CallbackBase
 from ansible import constants as C
 import logging
 
+from subspace.log_aggregation import ResultAggregator
+from subspace.log_limits import ResultLimiter
+
 default_logger = logging.getLogger(__name__)
 default_logger.setLevel(logging.DEBUG)
 stderr_handler = logging.StreamHandler(sys.stderr)
@@ -43,6 +46,10 @@ class CallbackModule(CallbackBase):
             python_play_logger = default_logger
         self.play_logger = PythonLogger(python_play_logger)
         self.username = username
+        # Truncation/sampling of logged results, see subspace.log_limits
+        self.limiter = None
+        # Grouping of identical results, see subspace.log_aggregation
+        self.aggregator = None
         # Start counting time from creation to completion of exection.
         self.start_time = datetime.now()
 
@@ -68,9 +75,9 @@ class CallbackModule(CallbackBase):
             self._process_items(result)  # item_on_failed, item_on_skipped, item_on_ok
         else:
             if delegated_vars:
-                self.play_logger.log.error("fatal: [%s -> %s]: FAILED! => %s" % (result._host.get_name(), delegated_vars['ansible_host'], self._dump_results(result._result)))
+                self._log_result('error', "fatal: [%s -> %s]: FAILED! => %s" % (result._host.get_name(), delegated_vars['ansible_host'], self._dump_results(result._result, failed=True)), result)
             else:
-                self.play_logger.log.error("fatal: [%s]: FAILED! => %s" % (result._host.get_name(), self._dump_results(result._result)))
+                self._log_result('error', "fatal: [%s]: FAILED! => %s" % (result._host.get_name(), self._dump_results(result._result, failed=True)), result)
 
     def v2_runner_item_on_ok(self, result):
         delegated_vars = result._result.get('_ansible_delegated_vars', None)
@@ -90,7 +97,9 @@ class CallbackModule(CallbackBase):
 
         if (self._display.verbosity > 0 or '_ansible_verbose_always' in result._result) and not '_ansible_verbose_override' in result._result:
             msg += " => %s" % self._dump_results(result._result)
-        self.play_logger.log.info(msg)
+        msg = self._sample_ok(result, msg)
+        if msg:
+            self._log_result('info', msg, result)
 
     def v2_runner_item_on_failed(self, result):
         delegated_vars = result._result.get('_ansible_delegated_vars', None)
@@ -102,7 +111,7 @@ class CallbackModule(CallbackBase):
             else:
                 msg = "An exception occurred during task execution. The full traceback is:\n" + result._result['exception']
 
-            self.play_logger.log.info(msg)
+            self._log_result('info', msg, result)
 
             # finally, remove the exception from the result so it's not shown every time
             del result._result['exception']
@@ -113,7 +122,7 @@ class CallbackModule(CallbackBase):
         else:
             msg += "[%s]" % (result._host.get_name())
 
-        self.play_logger.log.info(msg + " (item=%s) => %s" % (self._get_item(result._result), self._dump_results(result._result)))
+        self._log_result('info', msg + " (item=%s) => %s" % (self._get_item(result._result), self._dump_results(result._result, failed=True)), result)
         self._handle_warnings(result._result)
 
     def v2_runner_item_on_skipped(self, result):
@@ -121,7 +130,7 @@ class CallbackModule(CallbackBase):
             msg = "skipping: [%s] => (item=%s) " % (result._host.get_name(), self._get_item(result._result))
             if (self._display.verbosity > 0 or '_ansible_verbose_always' in result._result) and not '_ansible_verbose_override' in result._result:
                 msg += " => %s" % self._dump_results(result._result)
-            self.play_logger.log.info(msg)
+            self._log_result('info', msg, result)
 
     def v2_runner_on_ok(self, result):
         self._clean_results(result._result, result._task.action)
@@ -144,11 +153,54 @@ class CallbackModule(CallbackBase):
             result_msg = result._result['msg']
             # if result_msg == 'All items completed':
             #     result_msg += self._loop_result_items(result)
+            if self.limiter is not None:
+                result_msg = self.limiter.limit_fields({'msg': result_msg})['msg']
             msg += " - %s" % result_msg
         if result._task.loop and 'results' in result._result:
             self._process_items(result)  # item_on_failed, item_on_skipped, item_on_ok
         else:
-            self.play_logger.log.info(msg)
+            msg = self._sample_ok(result, msg)
+            if msg:
+                self._log_result('info', msg, result)
+
+    def _dump_results(self, result, indent=None, sort_keys=True, keep_invocation=False, failed=False):
+        if self.limiter is None:
+            return super(CallbackModule, self)._dump_results(result, indent, sort_keys, keep_invocation)
+        if not failed:
+            result = self.limiter.limit_fields(result)
+        dumped = super(CallbackModule, self)._dump_results(result, indent, sort_keys, keep_invocation)
+        return self.limiter.cap(dumped, failed=failed)
+
+    def _log_result(self, level, msg, result):
+        """
+        Log a per-host result line, or buffer it when aggregating.
+        """
+        if self.aggregator is None:
+            getattr(self.play_logger.log, level)(msg)
+        else:
+            self.aggregator.add(level, msg, result._host.get_name())
+
+    def _flush_results(self):
+        if self.aggregator is None:
+            return
+        for (level, msg) in self.aggregator.flush():
+            getattr(self.play_logger.log, level)(msg)
+
+    def _sample_ok(self, result, msg):
+        """
+        Return `msg` if this ok result should be logged, None if it is one of
+        the identical results left out by the limiter.
+        """
+        if self.limiter is None or self.limiter.ok_sample_rate == 1:
+            return msg
+        host_name = result._host.get_name()
+        key = (result._task._uuid, msg.replace("[%s" % host_name, "[", 1))
+        count = self.limiter.sample(key)
+        if count is None:
+            return None
+        if count > 1:
+            msg += " (%d identical results, 1 in %d logged)" % (count, self.limiter.ok_sample_rate)
+        return msg
 
     def _loop_result_items(self, result, prepend='', separator='\n'):
         result_msg = prepend
@@ -172,22 +224,33 @@ class CallbackModule(CallbackBase):
             self._process_items(result)  # item_on_failed, item_on_skipped, item_on_ok
         else:
             msg = "skipping: [%s]" % result._host.get_name()
-            self.play_logger.log.info(msg)
+            self._log_result('info', msg, result)
 
     def v2_runner_on_unreachable(self, result):
         delegated_vars = result._result.get('_ansible_delegated_vars', None)
         if delegated_vars:
-            self.play_logger.log.error("fatal: [%s -> %s]: UNREACHABLE! => %s" % (result._host.get_name(), delegated_vars['ansible_host'], self._dump_results(result._result)))
+            self._log_result('error', "fatal: [%s -> %s]: UNREACHABLE! => %s" % (result._host.get_name(), delegated_vars['ansible_host'], self._dump_results(result._result, failed=True)), result)
         else:
-            self.play_logger.log.error("fatal: [%s]: UNREACHABLE! => %s" % (result._host.get_name(), self._dump_results(result._result)))
+            self._log_result('error', "fatal: [%s]: UNREACHABLE! => %s" % (result._host.get_name(), self._dump_results(result._result, failed=True)), result)
 
     def v2_runner_on_no_hosts(self, task):
         self.play_logger.log.warn("skipping: no hosts matched")
 
     def v2_playbook_on_task_start(self, task, is_conditional):
+        self._flush_results()
+        if self.limiter is not None:
+            self.limiter.reset()
         self.play_logger.log.info("TASK [%s]" % task.get_name().strip())
 
+    def v2_playbook_on_handler_task_start(self, task):
+        self._flush_results()
+        # Only aggregated handler results need a header to be told apart
+        # from the results of the task before them
+        if self.aggregator is not None:
+            self.play_logger.log.info("RUNNING HANDLER [%s]" % task.get_name().strip())
+
     def v2_playbook_on_play_start(self, play):
+        self._flush_results()
         name = play.get_name().strip()
         if not name:
             msg = "PLAY"
@@ -212,7 +275,7 @@ class CallbackModule(CallbackBase):
                 msg = "ok: [%s]" % result._host.get_name()
         msg += " => (item=%s)" % (result._result['item'])
 
-        self.play_logger.log.info(msg)
+        self._log_result('info', msg, result)
 
     def v2_playbook_item_on_failed(self, result):
         delegated_vars = result._result.get('_ansible_delegated_vars', None)
@@ -225,15 +288,16 @@ class CallbackModule(CallbackBase):
             del result._result['exception']
 
         if delegated_vars:
-            self.play_logger.log.info("failed: [%s -> %s] => (item=%s) => %s" % (result._host.get_name(), delegated_vars['ansible_host'], result._result['item'], self._dump_results(result._result)))
+            self._log_result('info', "failed: [%s -> %s] => (item=%s) => %s" % (result._host.get_name(), delegated_vars['ansible_host'], result._result['item'], self._dump_results(result._result, failed=True)), result)
         else:
-            self.play_logger.log.info("failed: [%s] => (item=%s) => %s" % (result._host.get_name(), result._result['item'], self._dump_results(result._result)))
+            self._log_result('info', "failed: [%s] => (item=%s) => %s" % (result._host.get_name(), result._result['item'], self._dump_results(result._result, failed=True)), result)
 
     def v2_playbook_item_on_skipped(self, result):
         msg = "skipping: [%s] => (item=%s) " % (result._host.get_name(), result._result['item'])
-        self.play_logger.log.info(msg)
+        self._log_result('info', msg, result)
 
     def v2_playbook_on_stats(self, stats):
+        self._flush_results()
         run_time = datetime.now() - self.start_time
 
         hosts = sorted(stats.processed.keys())
@@ -266,14 +330,18 @@ class CallbackModule(CallbackBase):
         )
         self.play_logger.log.info(msg)
 
-    def start_logging(self, logger=None, username=None):
+    def start_logging(self, logger=None, username=None, log_limits=None, aggregate_logs=None):
         """
         Special callback added to this callback plugin
         * Called by Runner objet
         :param logger:
+        :param log_limits: see subspace.log_limits.ResultLimiter.from_option
+        :param aggregate_logs: see subspace.log_aggregation.ResultAggregator.from_option
         :return:
         """
         self.username = username
+        self.limiter = ResultLimiter.from_option(log_limits)
+        self.aggregator = ResultAggregator.from_option(aggregate_logs)
         if logger:
             self.play_logger.set_logger(logger)
         if username:
@@ -0,0 +1,83 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import re
+import time
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.plugins.connection import ConnectionBase
+
+try:
+    from __main__ import display
+except ImportError:
+    from ansible.utils.display import Display
+    display = Display()
+
+from subspace import stub
+__all__ = ['Connection']
+
+
+# `echo ansible-tmp-1490000000.0-123="...` from the shell plugin's mkdtemp
+TMP_PATH_RE = re.compile(r'echo (ansible-tmp-[\w.-]+)=')
+# Modules are copied to <tmp>/<module name>.py and run by the interpreter;
+# chmod/rm of the same path must not match.
+MODULE_RE = re.compile(r'python[\w.]*\s+\S*ansible-tmp-[\w.-]+/(\w+)\.py\b')
+
+
+class Connection(ConnectionBase):
+    '''
+    Controller-only connection returning canned module results.
+    See subspace.stub for the available settings.
+    '''
+
+    transport = 'stub'
+    has_pipelining = False
+
+    def __init__(self, *args, **kwargs):
+        super(Connection, self).__init__(*args, **kwargs)
+        stub.reseed()
+
+    @property
+    def _host(self):
+        return self._play_context.remote_addr
+
+    def _connect(self):
+        if not self._connected:
+            if stub.is_unreachable(self._host):
+                raise AnsibleConnectionFailure(
+                    "stub: %s is configured as unreachable" % self._host)
+            display.vvv(u"ESTABLISH STUB CONNECTION", host=self._host)
+            self._connected = True
+        return self
+
+    def exec_command(self, cmd, in_data=None, sudoable=True):
+        super(Connection, self).exec_command(cmd, in_data=in_data, sudoable=sudoable)
+        display.vvv(u"STUB EXEC %s" % cmd, host=self._host)
+
+        tmp_match = TMP_PATH_RE.search(cmd)
+        if tmp_match:
+            basefile = tmp_match.group(1)
+            return (0, "%s=/tmp/subspace-stub/%s\n" % (basefile, basefile), '')
+
+        module_match = MODULE_RE.search(cmd)
+        if module_match:
+            delay = stub.latency()
+            if delay:
+                time.sleep(delay)
+            result = stub.module_result(self._host, module_match.group(1))
+            return (0, json.dumps(result), '')
+
+        # mkdir/chmod/rm and friends always succeed
+        return (0, '', '')
+
+    def put_file(self, in_path, out_path):
+        super(Connection, self).put_file(in_path, out_path)
+
+    def fetch_file(self, in_path, out_path):
+        super(Connection, self).fetch_file(in_path, out_path)
+        # Hand the fetch action an (empty) file to checksum
+        open(out_path, 'w').close()
+
+    def close(self):
+        self._connected = False
@@ -1,10 +1,11 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import time
+
 from ansible.compat.six import iteritems, text_type
 
 from ansible.errors import AnsibleError
-from ansible.template import Templar
 
 from ansible.compat.six.moves import queue as Queue
 from ansible.inventory.host import Host
@@ -32,11 +33,23 @@ except ImportError:
     from ansible.utils.display import Display
     display = Display()
 
+from subspace import metrics, profiler
+from subspace.handlers import HandlerIndex
 from subspace.task_queue_manager import SubspaceTaskQueueManager as SubspaceTQM
-__all__ = ['StrategyModule']
+from subspace.template_cache import SubspaceTemplar
+__all__ = ['SubspaceStrategyBase', 'StrategyModule']
+
 
+class SubspaceStrategyBase(AnsibleStrategyBase):
+    '''
+    Subspace stats and logging for Ansible strategies. Combine it with an
+    Ansible strategy, listing this class first so its methods take precedence.
+    '''
 
-class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
+    def __init__(self, tqm):
+        super(SubspaceStrategyBase, self).__init__(tqm)
+        # (host name, task UUID) -> time the task was queued
+        self._queued_at = {}
 
     def increment_stat(self, what, host_name, play, task):
         if type(self._tqm) == SubspaceTQM:
@@ -45,6 +58,44 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
             self._tqm.send_callback('record_log', "Using the 'traditional' TQM results in loss of functionality")
             return self._tqm._stats.increment(what, host_name)
 
+    def run(self, iterator, play_context):
+        self._current_play = iterator._play
+        return super(SubspaceStrategyBase, self).run(iterator, play_context)
+
+    def _get_handler_index(self, play):
+        handler_index = getattr(self, '_handler_index', None)
+        if handler_index is None or not handler_index.is_current(play):
+            handler_index = self._handler_index = HandlerIndex(play)
+        return handler_index
+
+    def _busy_workers(self):
+        return len([1 for (worker_prc, rslt_q) in self._tqm._workers
+                    if worker_prc and worker_prc.is_alive()])
+
+    def _queue_task(self, host, task, task_vars, play_context):
+        '''
+        With adaptive forks, wait until fewer workers than the controller's
+        current limit are busy before handing the task to a worker.
+        '''
+        # Task durations are measured from here to the final result
+        self._queued_at[(host.name, task._uuid)] = time.time()
+        controller = getattr(self._tqm, '_fork_controller', None)
+        if controller is None:
+            return super(SubspaceStrategyBase, self)._queue_task(host, task, task_vars, play_context)
+
+        while self._busy_workers() >= controller.forks:
+            controller.slot_waited()
+            controller.observe_backlog(len(self._results))
+            controller.maybe_adjust()
+            time.sleep(0.001)
+        forks = controller.maybe_adjust()
+        metrics.set_gauge('subspace_tqm_effective_forks', forks)
+
+        controller.task_queued((host.name, task._uuid))
+        if type(self._tqm) == SubspaceTQM:
+            self._tqm._stats.record_forks(getattr(self, '_current_play', None), task, forks)
+        return super(SubspaceStrategyBase, self)._queue_task(host, task, task_vars, play_context)
+
     def _process_pending_results(self, iterator, one_pass=False, max_passes=None):
         '''
         Reads results off the final queue and takes appropriate action
@@ -64,7 +115,7 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                 for handler_task in handler_block.block:
                     if handler_task.name:
                         handler_vars = self._variable_manager.get_vars(loader=self._loader, play=iterator._play, task=handler_task)
-                        templar = Templar(loader=self._loader, variables=handler_vars)
+                        templar = SubspaceTemplar(loader=self._loader, variables=handler_vars)
                         try:
                             # first we check with the full result of get_name(), which may
                             # include the role name (if the handler is from a role). If that
@@ -87,18 +138,29 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
 
 
         def search_handler_blocks_by_uuid(handler_uuid, handler_blocks):
-            for handler_block in handler_blocks:
-                for handler_task in handler_block.block:
-                    if handler_uuid == handler_task._uuid:
-                        return handler_task
-            return None
+            return handler_index.by_uuid.get(handler_uuid)
+
+        def find_handler_by_name(handler_name):
+            # Handler names are templated without host vars, so the
+            # result holds for every host notifying the same name
+            if handler_name not in handler_index.by_name:
+                handler_index.by_name[handler_name] = search_handler_blocks_by_name(handler_name, iterator._play.handlers)
+            return handler_index.by_name[handler_name]
+
+        def find_handlers_by_parent_name(handler_name):
+            if handler_name not in handler_index.by_parent_name:
+                handler_index.by_parent_name[handler_name] = [
+                    target_handler for target_handler in handler_index.include_parented
+                    if target_handler._uuid in self._notified_handlers
+                    and parent_handler_match(target_handler, handler_name)]
+            return handler_index.by_parent_name[handler_name]
 
         def parent_handler_match(target_handler, handler_name):
             if target_handler:
                 if isinstance(target_handler, (TaskInclude, IncludeRole)):
                     try:
                         handler_vars = self._variable_manager.get_vars(loader=self._loader, play=iterator._play, task=target_handler)
-                        templar = Templar(loader=self._loader, variables=handler_vars)
+                        templar = SubspaceTemplar(loader=self._loader, variables=handler_vars)
                         target_handler_name = templar.template(target_handler.name)
                         if target_handler_name == handler_name:
                             return True
@@ -112,15 +174,27 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
             else:
                 return False
 
+        def observe_result(status, started):
+            metrics.inc('subspace_strategy_results_total', status=status)
+            metrics.observe('subspace_strategy_result_seconds', time.time() - started)
+
+        fork_controller = getattr(self._tqm, '_fork_controller', None)
+        handler_index = self._get_handler_index(iterator._play)
+
         cur_pass = 0
         while True:
             try:
                 self._results_lock.acquire()
+                metrics.set_gauge('subspace_strategy_result_queue_depth', len(self._results))
+                if fork_controller is not None:
+                    fork_controller.observe_backlog(len(self._results))
                 task_result = self._results.pop()
             except IndexError:
                 break
             finally:
                 self._results_lock.release()
+            result_started = time.time()
+            result_key = (task_result._host, task_result._task)
 
             # get the original host and task. We then assign them to the TaskResult for use in callbacks/etc.
             original_host = get_original_host(task_result._host)
@@ -142,6 +216,7 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
             # send callbacks for 'non final' results
             if '_ansible_retry' in task_result._result:
                 self._tqm.send_callback('v2_runner_retry', task_result)
+                observe_result('retry', result_started)
                 continue
             elif '_ansible_item_result' in task_result._result:
                 if task_result.is_failed() or task_result.is_unreachable():
@@ -153,6 +228,7 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                         if self._diff:
                             self._tqm.send_callback('v2_on_file_diff', task_result)
                     self._tqm.send_callback('v2_runner_item_on_ok', task_result)
+                observe_result('item', result_started)
                 continue
 
             if original_task.register:
@@ -168,6 +244,7 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
             # all host status messages contain 2 entries: (msg, task_result)
             role_ran = False
             if task_result.is_failed():
+                result_status = 'failed'
                 role_ran = True
                 ignore_errors = original_task.ignore_errors
                 if not ignore_errors:
@@ -207,14 +284,17 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                         self.increment_stat('changed', original_host.name, iterator._play, original_task)
                 self._tqm.send_callback('v2_runner_on_failed', task_result, ignore_errors=ignore_errors)
             elif task_result.is_unreachable():
+                result_status = 'unreachable'
                 self._tqm._unreachable_hosts[original_host.name] = True
                 iterator._play._removed_hosts.append(original_host.name)
                 self.increment_stat('dark', original_host.name, iterator._play, original_task)
                 self._tqm.send_callback('v2_runner_on_unreachable', task_result)
             elif task_result.is_skipped():
+                result_status = 'skipped'
                 self.increment_stat('skipped', original_host.name, iterator._play, original_task)
                 self._tqm.send_callback('v2_runner_on_skipped', task_result)
             else:
+                result_status = 'ok'
                 role_ran = True
 
                 if original_task.loop:
@@ -237,7 +317,8 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                                 # dependency chain of the current task (if it's from a role), otherwise
                                 # we just look through the list of handlers in the current play/all
                                 # roles and use the first one that matches the notify name
-                                target_handler = search_handler_blocks_by_name(handler_name, iterator._play.handlers)
+                                with profiler.phase('handler_search'):
+                                    target_handler = find_handler_by_name(handler_name)
                                 if target_handler is not None:
                                     found = True
                                     if original_host not in self._notified_handlers[target_handler._uuid]:
@@ -247,9 +328,8 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                                 else:
                                     # As there may be more than one handler with the notified name as the
                                     # parent, so we just keep track of whether or not we found one at all
-                                    for target_handler_uuid in self._notified_handlers:
-                                        target_handler = search_handler_blocks_by_uuid(target_handler_uuid, iterator._play.handlers)
-                                        if target_handler and parent_handler_match(target_handler, handler_name):
+                                    with profiler.phase('handler_search'):
+                                        for target_handler in find_handlers_by_parent_name(handler_name):
                                             found = True
                                             if original_host not in self._notified_handlers[target_handler._uuid]:
                                                 self._notified_handlers[target_handler._uuid].append(original_host)
@@ -352,6 +432,14 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
                         role_obj._had_task_run[original_host.name] = True
 
             ret_results.append(task_result)
+            observe_result(result_status, result_started)
+            queued_at = self._queued_at.pop(result_key, None)
+            if queued_at is not None and type(self._tqm) == SubspaceTQM:
+                self._tqm._stats.record_duration(
+                    original_host.name, iterator._play, original_task,
+                    result_started - queued_at, result_status)
+            if fork_controller is not None:
+                fork_controller.result_received(result_key)
 
             if one_pass or max_passes is not None and (cur_pass+1) >= max_passes:
                 break
@@ -421,3 +509,10 @@ class StrategyModule(AnsibleLinearStrategyModule, AnsibleStrategyBase):
         self._tqm.send_callback('v2_playbook_on_include', included_file)
         display.debug("done processing included file")
         return block_list
+
+
+class StrategyModule(SubspaceStrategyBase, AnsibleLinearStrategyModule):
+    '''
+    The 'linear' strategy, with subspace stats and logging.
+    '''
+    pass
@@ -0,0 +1,16 @@
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.plugins.strategy.free import StrategyModule \
+    as AnsibleFreeStrategyModule
+
+from subspace.plugins.strategy.subspace import SubspaceStrategyBase
+__all__ = ['StrategyModule']
+
+
+class StrategyModule(SubspaceStrategyBase, AnsibleFreeStrategyModule):
+    '''
+    The 'free' strategy, with subspace stats and logging: every host runs
+    through the play as fast as it can, without waiting on the others.
+    '''
+    pass
@@ -0,0 +1,138 @@
+"""
+Pre-flight reachability probe.
+
+An unreachable host is normally only noticed when a worker's SSH connection
+times out, and every play pays that timeout again. With `probe=` the runner
+first opens a TCP connection to the SSH port of every target host, all in
+parallel with a short timeout. Hosts that do not answer are marked
+unreachable in the stats (`dark`, with the error in `probe_failures`) and
+removed from the subset before any worker is forked.
+
+Only hosts using an SSH-based connection (ssh, paramiko, smart) are probed.
+Connection vars are templated against the host's inventory vars; hosts whose
+address, port or connection can not be resolved that way (ex: they use a fact)
+are not probed.
+"""
+import socket
+from multiprocessing.pool import ThreadPool
+
+
+__all__ = ['ReachabilityProbe', 'connection_vars']
+
+
+PROBED_CONNECTIONS = ('smart', 'ssh', 'paramiko')
+
+CONNECTION_VARS = (
+    'ansible_connection', 'ansible_host', 'ansible_ssh_host',
+    'ansible_port', 'ansible_ssh_port', 'ansible_user', 'ansible_ssh_user',
+    'ansible_ssh_private_key_file')
+
+
+def connection_vars(inventory, host):
+    """
+    Return the connection vars set for `host` (by its groups or itself),
+    templated against its inventory vars, or None if one of them can not be
+    resolved before the run.
+    """
+    from ansible.template import Templar
+    from ansible.utils.vars import combine_vars
+
+    host_vars = combine_vars(host.get_group_vars(), inventory.get_vars(host.name))
+    templar = Templar(loader=None, variables=host_vars)
+    resolved = {}
+    for name in CONNECTION_VARS:
+        value = host_vars.get(name)
+        if value is None:
+            continue
+        try:
+            value = templar.template(value)
+        except Exception:
+            # Undefined vars, lookups needing a loader, ...
+            return None
+        if templar._contains_vars(value):
+            return None
+        resolved[name] = value
+    return resolved
+
+
+class ReachabilityProbe(object):
+    """
+    :timeout: Seconds to wait for each TCP connection.
+    :max_workers: Probes running at the same time.
+    :port: Port to probe when the host sets none (default: ansible's
+           remote port, or 22).
+    """
+
+    def __init__(self, timeout=2.0, max_workers=64, port=None):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.port = port
+
+    def __repr__(self):
+        return "ReachabilityProbe(timeout=%r, max_workers=%r, port=%r)" % (
+            self.timeout, self.max_workers, self.port)
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a probe from the `probe` option: None/False (disabled), True
+        (defaults), a dict of keyword args or a ReachabilityProbe.
+        """
+        if not value:
+            return None
+        if isinstance(value, ReachabilityProbe):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls()
+
+    def targets(self, inventory, connection=None):
+        """
+        Return (host name, address, port) for every host in the current
+        subset that connects over SSH and whose connection vars resolve.
+        """
+        from ansible import constants as C
+        default_port = self.port or C.DEFAULT_REMOTE_PORT or 22
+        targets = []
+        for host in inventory.get_hosts():
+            host_vars = connection_vars(inventory, host)
+            if host_vars is None:
+                continue
+            host_connection = host_vars.get('ansible_connection', connection or 'smart')
+            if host_connection not in PROBED_CONNECTIONS:
+                continue
+            address = host_vars.get('ansible_host') or host_vars.get('ansible_ssh_host') or host.name
+            port = host_vars.get('ansible_port') or host_vars.get('ansible_ssh_port') or default_port
+            try:
+                port = int(port)
+            except (TypeError, ValueError):
+                continue
+            targets.append((host.name, address, port))
+        return targets
+
+    def _connect(self, target):
+        (name, address, port) = target
+        try:
+            sock = socket.create_connection((address, port), self.timeout)
+        except (socket.error, socket.timeout) as exc:
+            return (name, "%s:%s: %s" % (address, port, exc))
+        sock.close()
+        return (name, None)
+
+    def probe(self, targets):
+        """
+        Connect to all `targets` in parallel. Returns a dict of host name to
+        error message for the hosts that could not be reached.
+        """
+        if not targets:
+            return {}
+        pool = ThreadPool(min(self.max_workers, len(targets)))
+        try:
+            results = pool.map(self._connect, targets)
+        finally:
+            pool.close()
+            pool.join()
+        return dict((name, error) for (name, error) in results if error)
+
+    def run(self, inventory, connection=None):
+        return self.probe(self.targets(inventory, connection))
@@ -0,0 +1,202 @@
+"""
+Controller-side profiling hooks for subspace.
+
+A Profiler records how long each named phase of a run takes (playbook
+loading, play setup, strategy execution, handler search, callbacks, ...)
+and, while it is running, samples the Python stack of the profiled thread
+from a background thread. Samples are written in the "collapsed stack"
+format understood by flamegraph.pl, speedscope and friends:
+
+    phase:execution;run (runner.py:190);...;template (__init__.py:400) 42
+
+When no profiler is active, `phase()` returns a shared no-op context
+manager, so the hooks cost one global lookup.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+
+__all__ = ['Profiler', 'phase', 'get_active']
+
+
+DEFAULT_INTERVAL = 0.005
+PHASES_FILE = 'profile-phases.json'
+COLLAPSED_FILE = 'profile.collapsed'
+
+_active = None
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._pop(self.name, time.time() - self.start)
+        return False
+
+
+def phase(name):
+    """
+    Context manager recording `name` on the active profiler, if any.
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _active.phase(name)
+
+
+def get_active():
+    return _active
+
+
+class Profiler(object):
+    """
+    Usage:
+        profiler = Profiler('/tmp/subspace-profile')
+        profiler.start()
+        try:
+            ... run playbooks ...
+        finally:
+            profiler.stop()
+        profiler.write()
+
+    :output_dir: Directory receiving the phase breakdown and collapsed stacks.
+    :interval: Seconds between stack samples. Use 0 to only time phases.
+    """
+
+    def __init__(self, output_dir, interval=DEFAULT_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.phases = {}
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stack = []
+        self._thread_id = None
+        self._sampler = None
+        self._stopping = threading.Event()
+
+    def phase(self, name):
+        if threading.current_thread().ident != self._thread_id:
+            # Only the profiled thread maintains the phase stack.
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def _push(self, name):
+        self._stack.append(name)
+
+    def _pop(self, name, seconds):
+        self._stack.pop()
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = {
+                'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        stats['calls'] += 1
+        stats['total_seconds'] += seconds
+        if seconds > stats['max_seconds']:
+            stats['max_seconds'] = seconds
+
+    def start(self):
+        global _active
+        if _active is not None and _active is not self:
+            raise RuntimeError("Another subspace Profiler is already active")
+        _active = self
+        self._thread_id = threading.current_thread().ident
+        self.started_at = time.time()
+        self._stopping.clear()
+        if self.interval:
+            self._sampler = threading.Thread(
+                target=self._sample_loop, name='subspace-profiler')
+            self._sampler.daemon = True
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        global _active
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self.started_at is not None:
+            self.elapsed += time.time() - self.started_at
+            self.started_at = None
+        if _active is self:
+            _active = None
+        return self
+
+    def _sample_loop(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._record(frame, list(self._stack))
+
+    def _record(self, frame, phases):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append("%s (%s:%d)" % (
+                code.co_name, os.path.basename(code.co_filename),
+                code.co_firstlineno))
+            frame = frame.f_back
+        frames.reverse()
+        key = ';'.join(['phase:%s' % name for name in phases] + frames)
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def breakdown(self):
+        """
+        Return the per-phase timings, slowest first.
+        """
+        rows = []
+        for name, stats in self.phases.items():
+            row = dict(stats, phase=name)
+            if self.elapsed:
+                row['percent'] = round(100.0 * stats['total_seconds'] / self.elapsed, 2)
+            rows.append(row)
+        rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+        return rows
+
+    def write(self):
+        """
+        Write the phase breakdown (JSON) and collapsed stacks to `output_dir`.
+        Returns the two paths written.
+        """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        phases_path = os.path.join(self.output_dir, PHASES_FILE)
+        with open(phases_path, 'w') as the_file:
+            json.dump({
+                'elapsed_seconds': self.elapsed,
+                'interval': self.interval,
+                'samples': self.samples,
+                'phases': self.breakdown(),
+            }, the_file, indent=2, sort_keys=True)
+        collapsed_path = os.path.join(self.output_dir, COLLAPSED_FILE)
+        with open(collapsed_path, 'w') as the_file:
+            for stack, count in sorted(self.stacks.items()):
+                the_file.write("%s %d\n" % (stack, count))
+        return (phases_path, collapsed_path)
@@ -1,24 +1,28 @@
 import os
 import stat
 import operator
+import tempfile
+import time
 
 import logging
 
-from ansible.inventory import Inventory
-from ansible.vars import VariableManager
-from ansible.cli.playbook import CLI, PlaybookCLI
-from ansible.utils.vars import load_options_vars
-from ansible.parsing.dataloader import DataLoader
-from ansible.playbook.block import Block
-from ansible.playbook.play_context import PlayContext
-from ansible.utils.vars import load_extra_vars
+# NOTE: Only light-weight Ansible modules are imported here. The inventory,
+# vars, playbook and executor stacks are imported when a run starts,
+# which keeps `import subspace.runner` cheap for short-lived workers.
+from ansible.cli import CLI
 from ansible import constants as C
 
 from ansible.utils.display import Display
 from ansible.errors import AnsibleError
 
+from subspace import listing, metrics, profiler, shard, stub, validation
+from subspace.checkpoint import Checkpoint
+from subspace.content_hash import DEFAULT_PATH as DEFAULT_CONTENT_HASH_PATH, ContentHashStore
+from subspace.probe import ReachabilityProbe
+from subspace.ssh_pool import SSHMasterPool
+from subspace.history import RunHistory
+from subspace.config import ConfigOverlay
 from subspace.exceptions import NoValidHosts
-from subspace.executor import PlaybookExecutor
 from subspace.stats import SubspaceAggregateStats
 
 display = Display()
@@ -46,7 +50,7 @@ class RunnerOptions(object):
         ask_pass=False, private_key_file=None, remote_user='root', connection=None, timeout=None, ssh_common_args='',
         sftp_extra_args=None, scp_extra_args=None, ssh_extra_args='', poll_interval=None, seconds=None, check=False,
         syntax=None, diff=False, force_handlers=False, flush_cache=True, listtasks=None, listtags=None, module_path=None, su=None,
-        logger=None):
+        logger=None, adaptive_forks=None):
         # Dynamic sensible defaults
         if not logger:
             logger = default_logger
@@ -107,15 +111,18 @@ class RunnerOptions(object):
         self.listtags = listtags
         self.module_path = module_path
         self.logger = logger
+        # True, a dict of subspace.adaptive.AdaptiveForks settings, or None
+        self.adaptive_forks = adaptive_forks
 
 
-class PlaybookShell(PlaybookCLI):
+class PlaybookShell(CLI):
     """
     PlaybookShell uses RunnerOptions to replace 'args'
+    (It mirrors ansible.cli.playbook.PlaybookCLI without importing it.)
     To create a PlaybookShell:
         runner_opts = {'verbosity':4}
         Runner.factory(
-            host_file,
+            host_file,  # or hosts/groups/vars, see subspace.inventory.InventoryData
             os.path.join(playbook_dir, playbook_path),  # Also takes a playbook directory for list-of-files.
             extra_vars=extra_vars,
             limit_hosts='127.0.0.1',  # or IP/Hostname
@@ -165,22 +172,84 @@ class PlaybookShell(PlaybookCLI):
     def __init__(self, hosts_file, playbook_path, extra_vars, private_key_file,
                  limit_hosts=None, limit_playbooks=None,
                  group_vars_map={}, logger=None,
-                 use_password=None, callback=None, **runner_opts_args):
+                 use_password=None, callback=None, metrics_file=None,
+                 profile=None, stub_options=None, config=None,
+                 fast_fail=None, checkpoint=None, resume=False,
+                 skip_unchanged=None, log_limits=None, aggregate_logs=None,
+                 probe=None, ssh_pool=None, shards=None, history=None,
+                 vault_cache=None, **runner_opts_args):
 
         self.callback = callback
+        # When set, a Prometheus text snapshot is written here after run()
+        self.metrics_file = metrics_file
+        # profile: output directory, a subspace.profiler.Profiler or True
+        # (a temporary directory is created).
+        if profile is True:
+            profile = tempfile.mkdtemp(prefix='subspace-profile-')
+        if profile and not isinstance(profile, profiler.Profiler):
+            profile = profiler.Profiler(profile)
+        self.profiler = profile or None
+        # Settings for connection='stub', see subspace.stub
+        if stub_options:
+            stub.configure(**stub_options)
+        # Ansible settings for this runner only, see subspace.config
+        if not isinstance(config, ConfigOverlay):
+            config = ConfigOverlay(config)
+        # Shared SSH ControlMaster connections, see subspace.ssh_pool
+        self.ssh_pool = SSHMasterPool.from_option(ssh_pool)
+        if self.ssh_pool is not None:
+            config = config.merged(self.ssh_pool.ansible_settings())
+        self.config = config
+        # What to do with hosts that fail between playbooks, see subspace.fast_fail
+        self.fast_fail = fast_fail
+        # checkpoint: file recording per-host progress after each playbook.
+        # resume: skip the work recorded there (a path implies checkpoint=path)
+        if resume and not isinstance(resume, bool):
+            checkpoint = resume
+        if resume and not checkpoint:
+            raise ValueError("resume requires a checkpoint file")
+        self.checkpoint_file = checkpoint
+        self.resume = bool(resume)
+        # skip_unchanged: file recording clean runs (True for the default),
+        # see subspace.content_hash
+        self.skip_unchanged = skip_unchanged
+        # Truncation and sampling of logged results, see subspace.log_limits
+        self.log_limits = log_limits
+        # Grouping of identical results in the log, see subspace.log_aggregation
+        self.aggregate_logs = aggregate_logs
+        # Pre-flight TCP probe of the SSH port, see subspace.probe
+        self.probe = ReachabilityProbe.from_option(probe)
+        # Split the hosts of the subset across this many processes, see subspace.shard
+        self.shards = shards
+        self.sharded = None
+        # Store of past runs and their task durations, see subspace.history
+        self.history = RunHistory.from_option(history)
+        # Cache of decrypted vault files shared by runs, see subspace.vault_cache
+        # (tested against None: an empty VaultCache is falsy)
+        if vault_cache is not None:
+            from subspace.vault_cache import VaultCache
+            vault_cache = VaultCache.from_option(vault_cache)
+        self.vault_cache = vault_cache
         self.extra_vars = extra_vars  # Override 'extra vars'
-        self.options = RunnerOptions(
-                private_key_file=private_key_file,
-                subset=limit_hosts,
-                inventory=hosts_file,
-                logger=logger,
-                **runner_opts_args
-            )
+        # hosts_file: a path, or hosts, groups and vars as a
+        # subspace.inventory.InventoryData (or a dict of its arguments)
+        if isinstance(hosts_file, dict):
+            from subspace.inventory import InventoryData
+            hosts_file = InventoryData(**hosts_file)
+        with self.config:
+            self.options = RunnerOptions(
+                    private_key_file=private_key_file,
+                    subset=limit_hosts,
+                    inventory=hosts_file,
+                    logger=logger,
+                    **runner_opts_args
+                )
 
         # NOTE: Playbooks is usually a path
         # ex: deploy_playbooks/ _OR_ util_playbooks/check_networking.yml
         # it could also be a list of playbooks to be executed.
-        self._set_playbooks(playbook_path, limit_playbooks)
+        with metrics.timer('subspace_runner_phase_seconds', phase='playbook_discovery'):
+            self._set_playbooks(playbook_path, limit_playbooks)
 
         # Become Pass Needed if not logging in as user root
         if use_password:
@@ -189,6 +258,186 @@ class PlaybookShell(PlaybookCLI):
             passwords = None
 
     def run(self):
+        started = time.time()
+        if self.profiler:
+            self.profiler.start()
+        try:
+            with self.config:
+                if self._is_sharded():
+                    results = self._run_sharded()
+                else:
+                    results = self._run()
+        except Exception:
+            metrics.inc('subspace_runner_runs_total', result='error')
+            raise
+        else:
+            metrics.inc('subspace_runner_runs_total',
+                        result='ok' if results == 0 else 'failed')
+            self._record_history(started, results)
+            return results
+        finally:
+            if self.profiler:
+                self.profiler.stop()
+                self._write_profile()
+            if self.metrics_file and metrics.is_enabled():
+                metrics.dump(self.metrics_file)
+
+    def _record_history(self, started, results):
+        if self.history is None or getattr(self, 'stats', None) is None:
+            return
+        with metrics.timer('subspace_runner_phase_seconds', phase='history'):
+            run_id = self.history.record_run(
+                self.stats, results, started,
+                username=self.extra_vars.get('ATMOUSERNAME'),
+                subset=self.options.subset,
+                playbooks=self.playbooks)
+        self.options.logger.info("Run recorded as #%s in %s" % (run_id, self.history.path))
+
+    def _write_profile(self):
+        (phases_path, collapsed_path) = self.profiler.write()
+        for row in self.profiler.breakdown():
+            self.options.logger.info(
+                "Profile phase %s: %d calls, %.3fs total, %.3fs max"
+                % (row['phase'], row['calls'], row['total_seconds'], row['max_seconds']))
+        self.options.logger.info(
+            "Profile written to %s and %s" % (phases_path, collapsed_path))
+
+    def parse(self):
+        # Options come from RunnerOptions, there is no command line to parse.
+        pass
+
+    def _is_sharded(self):
+        if not self.shards or int(self.shards) < 2:
+            return False
+        # Listing and syntax checks are quick and print per playbook
+        return not (self.options.listhosts or self.options.listtasks
+                    or self.options.listtags or self.options.syntax)
+
+    def _set_vault_password(self, loader):
+        b_vault_pass = None
+        if self.options.vault_password_file:
+            # read vault_pass from a file
+            b_vault_pass = CLI.read_vault_password_file(self.options.vault_password_file, loader=loader)
+        elif self.options.ask_vault_pass:
+            b_vault_pass = self.ask_vault_passwords()
+        elif 'VAULT_PASS' in os.environ:
+            b_vault_pass = os.environ['VAULT_PASS']
+        if b_vault_pass is None:
+            return
+        loader.set_vault_password(b_vault_pass)
+        if self.vault_cache is not None:
+            loader._vault = self.vault_cache.vault_lib(loader._b_vault_password)
+
+    def _get_subset_host_names(self):
+        """
+        Resolve the names of the hosts in the subset, as a run would.
+        """
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.vars import VariableManager
+
+        from subspace.inventory import SubspaceInventory
+
+        loader = DataLoader()
+        self._set_vault_password(loader)
+        variable_manager = VariableManager()
+        inventory = SubspaceInventory(loader=loader, variable_manager=variable_manager, host_list=self.options.inventory)
+        variable_manager.set_inventory(inventory)
+        inventory.subset(self.options.subset)
+        return [host.name for host in inventory.get_hosts()]
+
+    def _run_sharded(self):
+        """
+        Run the playbooks for each shard of the subset in its own process.
+        Stats and registered results of all shards are merged into
+        self.stats and self.results.
+        """
+        if (self.options.ask_pass or self.options.become_ask_pass
+                or self.options.ask_vault_pass or self.options.ask_sudo_pass
+                or self.options.ask_su_pass):
+            raise ValueError("Sharded runs can not prompt for passwords")
+        with metrics.timer('subspace_runner_phase_seconds', phase='inventory_load'), profiler.phase('inventory_load'):
+            host_groups = shard.split_hosts(self._get_subset_host_names(), self.shards)
+        if len(host_groups) < 2:
+            return self._run()
+
+        self.options.logger.info(
+            "Running %d shards of %s hosts" % (len(host_groups), '/'.join(str(len(group)) for group in host_groups)))
+        with metrics.timer('subspace_runner_phase_seconds', phase='execution'), profiler.phase('execution'):
+            self.sharded = shard.run_shards(self, host_groups)
+        self.stats = self.sharded.stats
+        self.results = self.sharded.results
+        return self.sharded.rc
+
+    def _run_shard(self, index, host_names):
+        """
+        Entry point of a shard process: run limited to `host_names`.
+        """
+        self.options.subset = host_names
+        if self.checkpoint_file:
+            self.checkpoint_file = shard.shard_path(self.checkpoint_file, index)
+        if self.skip_unchanged:
+            self.skip_unchanged = shard.shard_path(
+                DEFAULT_CONTENT_HASH_PATH if self.skip_unchanged is True else self.skip_unchanged, index)
+        # The fork already carries the constants run() applied from self.config
+        return self._run()
+
+    def _probe_hosts(self, inventory):
+        """
+        Probe the hosts in the subset and remove the unreachable ones.
+        Returns a dict of unreachable host name to error.
+        """
+        if self.probe is None:
+            return {}
+        with metrics.timer('subspace_runner_phase_seconds', phase='probe'), profiler.phase('probe'):
+            unreachable_hosts = self.probe.run(inventory, self.options.connection)
+        if not unreachable_hosts:
+            return unreachable_hosts
+
+        for (host_name, error) in sorted(unreachable_hosts.items()):
+            self.options.logger.warn("Unreachable host %s removed from the run: %s" % (host_name, error))
+        subset = list(inventory._subset or ['all'])
+        subset.extend('!%s' % host_name for host_name in sorted(unreachable_hosts))
+        inventory.subset(subset)
+        if not inventory.get_hosts():
+            raise NoValidHosts("No hosts are reachable: %s" % ', '.join(sorted(unreachable_hosts)))
+        return unreachable_hosts
+
+    def _warm_up_connections(self, inventory):
+        """
+        Open (or reuse) the SSH masters of the hosts in the subset.
+        Returns a dict of host name to 'opened', 'reused' or 'failed'.
+        """
+        if self.ssh_pool is None:
+            return {}
+        with metrics.timer('subspace_runner_phase_seconds', phase='ssh_warmup'), profiler.phase('ssh_warmup'):
+            return self.ssh_pool.warm_up(self.ssh_pool.targets(inventory, self.options))
+
+    def _load_checkpoint(self):
+        if not self.checkpoint_file:
+            return None
+        if self.resume:
+            return Checkpoint.load(self.checkpoint_file)
+        return Checkpoint(self.checkpoint_file)
+
+    def _load_content_hashes(self):
+        if not self.skip_unchanged:
+            return None
+        if self.skip_unchanged is True:
+            return ContentHashStore.load()
+        return ContentHashStore.load(self.skip_unchanged)
+
+    def _flush_cache(self, inventory, variable_manager):
+        for host in inventory.list_hosts():
+            hostname = host.get_name()
+            variable_manager.clear_facts(hostname)
+
+    def _run(self):
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.utils.vars import load_extra_vars, load_options_vars
+        from ansible.vars import VariableManager
+
+        from subspace.executor import PlaybookExecutor
+        from subspace.inventory import SubspaceInventory
 
         # Note: slightly wrong, this is written so that implicit localhost
         # Manage passwords
@@ -205,6 +454,14 @@ class PlaybookShell(PlaybookCLI):
             if not (os.path.isfile(playbook) or stat.S_ISFIFO(os.stat(playbook).st_mode)):
                 raise AnsibleError("the playbook: %s does not appear to be a file" % playbook)
 
+        # Subspace injection
+        if self.options.listhosts or self.options.listtasks or self.options.listtags:
+            self._display_listing(self._list_playbooks(hosts=bool(self.options.listhosts)))
+            return 0
+        if self.options.syntax:
+            return self._check_syntax()
+        # End Subspace injection
+
         # don't deal with privilege escalation or passwords when we don't need to
         if not self.options.listhosts and not self.options.listtasks and not self.options.listtags and not self.options.syntax:
             self.normalize_become_options()
@@ -212,16 +469,7 @@ class PlaybookShell(PlaybookCLI):
             passwords = { 'conn_pass': sshpass, 'become_pass': becomepass }
 
         loader = DataLoader()
-
-        if self.options.vault_password_file:
-            # read vault_pass from a file
-            b_vault_pass = CLI.read_vault_password_file(self.options.vault_password_file, loader=loader)
-            loader.set_vault_password(b_vault_pass)
-        elif self.options.ask_vault_pass:
-            b_vault_pass = self.ask_vault_passwords()
-            loader.set_vault_password(b_vault_pass)
-        elif 'VAULT_PASS' in os.environ:
-            loader.set_vault_password(os.environ['VAULT_PASS'])
+        self._set_vault_password(loader)
 
         # create the variable manager, which will be shared throughout
         # the code, ensuring a consistent view of global variables
@@ -236,8 +484,9 @@ class PlaybookShell(PlaybookCLI):
         variable_manager.options_vars = load_options_vars(self.options)
 
         # create the inventory, and filter it based on the subset specified (if any)
-        inventory = Inventory(loader=loader, variable_manager=variable_manager, host_list=self.options.inventory)
-        variable_manager.set_inventory(inventory)
+        with metrics.timer('subspace_runner_phase_seconds', phase='inventory_load'), profiler.phase('inventory_load'):
+            inventory = SubspaceInventory(loader=loader, variable_manager=variable_manager, host_list=self.options.inventory)
+            variable_manager.set_inventory(inventory)
 
         # (which is not returned in list_hosts()) is taken into account for
         # warning if inventory is empty.  But it can't be taken into account for
@@ -255,9 +504,15 @@ class PlaybookShell(PlaybookCLI):
             # Invalid limit
             raise AnsibleError("Specified --limit (%s) does not match any hosts" % self.options.subset)
 
+        # Subspace injection
+        unreachable_hosts = self._probe_hosts(inventory)
+        ssh_connections = self._warm_up_connections(inventory)
+        # End Subspace injection
+
         # flush fact cache if requested
         if self.options.flush_cache:
-            self._flush_cache(inventory, variable_manager)
+            with metrics.timer('subspace_runner_phase_seconds', phase='fact_flush'), profiler.phase('fact_flush'):
+                self._flush_cache(inventory, variable_manager)
 
         hosts = inventory.get_hosts()
         if self.options.subset and not hosts:
@@ -270,14 +525,23 @@ class PlaybookShell(PlaybookCLI):
             variable_manager=variable_manager,
             loader=loader,
             options=self.options,
-            passwords=passwords)
-        play_to_path_map = self._map_plays_to_playbook_path()
-        pbex._tqm._stats = SubspaceAggregateStats(play_to_path_map)
+            passwords=passwords,
+            fast_fail=self.fast_fail,
+            checkpoint=self._load_checkpoint(),
+            resume=self.resume,
+            content_hashes=self._load_content_hashes())
+        # Plays are attributed to their playbook as PlaybookExecutor loads them
+        pbex._tqm._stats = SubspaceAggregateStats()
+        for (host_name, error) in sorted(unreachable_hosts.items()):
+            pbex._tqm._stats.record_probe_failure(host_name, error)
+        pbex._tqm._stats.ssh_connections.update(ssh_connections)
         pbex._tqm.load_callbacks()
         pbex._tqm.send_callback(
             'start_logging',
             logger=self.options.logger,
             username=self.extra_vars.get('ATMOUSERNAME', "No-User"),
+            log_limits=self.log_limits,
+            aggregate_logs=self.aggregate_logs,
         )
         for host in inventory._subset:
             variables = inventory.get_vars(host)
@@ -285,7 +549,8 @@ class PlaybookShell(PlaybookCLI):
                 "Vars found for hostname %s: %s" % (host, variables))
         # End Subspace injection
 
-        results = pbex.run()
+        with metrics.timer('subspace_runner_phase_seconds', phase='execution'), profiler.phase('execution'):
+            results = pbex.run()
         # Subspace injection
         stats = pbex._tqm._stats
         self.stats = stats
@@ -295,74 +560,160 @@ class PlaybookShell(PlaybookCLI):
         self.results = dict(pbex._variable_manager._nonpersistent_fact_cache)
         # End Subspace injection
 
-        if isinstance(results, list):
-            for p in results:
-
-                display.display('\nplaybook: %s' % p['playbook'])
-                for idx, play in enumerate(p['plays']):
-                    if play._included_path is not None:
-                        loader.set_basedir(play._included_path)
-                    else:
-                        pb_dir = os.path.realpath(os.path.dirname(p['playbook']))
-                        loader.set_basedir(pb_dir)
-
-                    msg = "\n  play #%d (%s): %s" % (idx + 1, ','.join(play.hosts), play.name)
-                    mytags = set(play.tags)
-                    msg += '\tTAGS: [%s]' % (','.join(mytags))
-
-                    if self.options.listhosts:
-                        playhosts = set(inventory.get_hosts(play.hosts))
-                        msg += "\n    pattern: %s\n    hosts (%d):" % (play.hosts, len(playhosts))
-                        for host in playhosts:
-                            msg += "\n      %s" % host
-
-                    display.display(msg)
-
-                    all_tags = set()
-                    if self.options.listtags or self.options.listtasks:
-                        taskmsg = ''
-                        if self.options.listtasks:
-                            taskmsg = '    tasks:\n'
-
-                        def _process_block(b):
-                            taskmsg = ''
-                            for task in b.block:
-                                if isinstance(task, Block):
-                                    taskmsg += _process_block(task)
-                                else:
-                                    if task.action == 'meta':
-                                        continue
-
-                                    all_tags.update(task.tags)
-                                    if self.options.listtasks:
-                                        cur_tags = list(mytags.union(set(task.tags)))
-                                        cur_tags.sort()
-                                        if task.name:
-                                            taskmsg += "      %s" % task.get_name()
-                                        else:
-                                            taskmsg += "      %s" % task.action
-                                        taskmsg += "\tTAGS: [%s]\n" % ', '.join(cur_tags)
-
-                            return taskmsg
-
-                        all_vars = variable_manager.get_vars(loader=loader, play=play)
-                        play_context = PlayContext(play=play, options=self.options)
-                        for block in play.compile():
-                            block = block.filter_tagged_tasks(play_context, all_vars)
-                            if not block.has_tasks():
-                                continue
-                            taskmsg += _process_block(block)
-
-                        if self.options.listtags:
-                            cur_tags = list(mytags.union(all_tags))
-                            cur_tags.sort()
-                            taskmsg += "      TASK TAGS: [%s]\n" % ', '.join(cur_tags)
-
-                        display.display(taskmsg)
+        return results
 
-            return 0
-        else:
-            return results
+    def validate_playbooks(self, playbook_paths=None, workers=None):
+        """
+        Syntax check playbooks in a pool of `workers` processes (default:
+        one per CPU) and return a report per playbook, see subspace.validation.
+
+        :playbook_paths: playbook files and directories (walked for playbooks
+                         like `playbook_path`), this runner's playbooks by default.
+        """
+        with self.config:
+            return self._validate_playbooks(playbook_paths, workers)
+
+    def _validate_playbooks(self, playbook_paths=None, workers=None):
+        if playbook_paths is None:
+            playbook_paths = self.playbooks
+        playbooks = []
+        for path in playbook_paths:
+            if os.path.isdir(path):
+                playbooks.extend(self._get_playbook_files(path))
+            else:
+                playbooks.append(path)
+        with metrics.timer('subspace_runner_phase_seconds', phase='validation'), profiler.phase('validation'):
+            return validation.validate_playbooks(self, playbooks, workers)
+
+    def _check_syntax(self):
+        reports = self._validate_playbooks()
+        for report in reports:
+            display.display('\nplaybook: %s' % report['playbook'])
+        errors = [report for report in reports if not report['ok']]
+        if errors:
+            raise AnsibleError("\n".join(
+                "%s: %s" % (report['playbook'], report['error']) for report in errors))
+        return 0
+
+    def list_playbooks(self, hosts=False, cache=None):
+        """
+        Describe every playbook: its plays, their blocks, tasks, tags and
+        roles, see subspace.listing. With hosts=True each play also lists
+        the hosts of the subset it matches.
+
+        :cache: a subspace.listing.ListingCache, the process-wide cache by
+                default, or False.
+        """
+        with self.config:
+            return self._list_playbooks(hosts, cache)
+
+    def _load_context(self):
+        """
+        Return the loader, variable manager and inventory (limited to the
+        subset) that playbooks are loaded with, for listing and validation.
+        """
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.utils.vars import load_extra_vars, load_options_vars
+        from ansible.vars import VariableManager
+
+        from subspace.inventory import SubspaceInventory
+
+        loader = DataLoader()
+        self._set_vault_password(loader)
+        variable_manager = VariableManager()
+        option_extra_vars = load_extra_vars(loader=loader, options=self.options)
+        option_extra_vars.update(self.extra_vars)
+        variable_manager.extra_vars = option_extra_vars
+        variable_manager.options_vars = load_options_vars(self.options)
+        inventory = SubspaceInventory(loader=loader, variable_manager=variable_manager, host_list=self.options.inventory)
+        variable_manager.set_inventory(inventory)
+        inventory.subset(self.options.subset)
+        return (loader, variable_manager, inventory)
+
+    def _list_playbooks(self, hosts=False, cache=None):
+        import copy
+
+        from subspace.executor import PlaybookExecutor
+
+        if cache is None:
+            cache = listing.default_cache
+        (loader, variable_manager, inventory) = self._load_context()
+
+        key = listing.options_key(self.options, variable_manager.extra_vars)
+        described = {}
+        if cache:
+            for playbook in self.playbooks:
+                plays = cache.get(playbook, key)
+                if plays is not None:
+                    described[playbook] = plays
+        missing = [playbook for playbook in self.playbooks if playbook not in described]
+        if missing:
+            # A listing executor loads and post-validates the plays only
+            options = copy.copy(self.options)
+            options.listtasks = True
+            pbex = PlaybookExecutor(
+                playbooks=missing,
+                inventory=inventory,
+                variable_manager=variable_manager,
+                loader=loader,
+                options=options,
+                passwords={})
+            with metrics.timer('subspace_runner_phase_seconds', phase='listing'), profiler.phase('listing'):
+                for entry in pbex.run():
+                    plays = []
+                    for play in entry['plays']:
+                        if play._included_path is not None:
+                            loader.set_basedir(play._included_path)
+                        else:
+                            loader.set_basedir(os.path.realpath(os.path.dirname(entry['playbook'])))
+                        plays.append(listing.describe_play(play, variable_manager, loader, options))
+                    described[entry['playbook']] = plays
+                    if cache:
+                        cache.put(entry['playbook'], key, plays, entry['plays'])
+            if cache:
+                cache.save()
+
+        playbooks = []
+        for playbook in self.playbooks:
+            plays = copy.deepcopy(described.get(playbook, []))
+            if hosts:
+                for play in plays:
+                    play['matched_hosts'] = sorted(set(host.name for host in inventory.get_hosts(play['hosts'])))
+            playbooks.append({'playbook': playbook, 'plays': plays})
+        return playbooks
+
+    def _display_listing(self, playbooks):
+        """
+        Print a list_playbooks() result the way ansible-playbook --list-* does.
+        """
+        def task_lines(entries):
+            taskmsg = ''
+            for entry in entries:
+                if 'tasks' in entry:
+                    taskmsg += task_lines(entry['tasks'])
+                else:
+                    taskmsg += "      %s\tTAGS: [%s]\n" % (entry['name'], ', '.join(entry['tags']))
+            return taskmsg
+
+        for p in playbooks:
+            display.display('\nplaybook: %s' % p['playbook'])
+            for idx, play in enumerate(p['plays']):
+                msg = "\n  play #%d (%s): %s" % (idx + 1, ','.join(play['hosts']), play['name'])
+                msg += '\tTAGS: [%s]' % (','.join(play['tags']))
+                if self.options.listhosts:
+                    msg += "\n    pattern: %s\n    hosts (%d):" % (play['hosts'], len(play['matched_hosts']))
+                    for host in play['matched_hosts']:
+                        msg += "\n      %s" % host
+                display.display(msg)
+
+                if self.options.listtags or self.options.listtasks:
+                    taskmsg = ''
+                    if self.options.listtasks:
+                        taskmsg = '    tasks:\n'
+                        taskmsg += task_lines(play['blocks'])
+                    if self.options.listtags:
+                        taskmsg += "      TASK TAGS: [%s]\n" % ', '.join(play['task_tags'])
+                    display.display(taskmsg)
 
     def _set_playbooks(self, playbook_path, limit_playbooks):
         if not isinstance(playbook_path, basestring):
@@ -410,30 +761,6 @@ class PlaybookShell(PlaybookCLI):
                         files.append(os.path.join(a_dir, f))
         return files
 
-    def _get_playbook_name(self, playbook_path):
-        key_name = ''
-        plays = []
-        with open(playbook_path,'r') as the_file:
-            for line in the_file.readlines():
-                if 'name:' in line.strip():
-                    # This is the name you will find in stats.
-                    key_name = line.replace('name:','').replace('- ','').strip()
-                    plays.append(key_name)
-        if not plays:
-            raise Exception(
-                "Error found in %s: All plays should include a name for CustomSubspaceStats to work properly." % playbook_path)
-        return plays
-
-    def _map_plays_to_playbook_path(self):
-        """
-        """
-        play_to_path_map = {}
-        for playbook_path in self.playbooks:
-            keys = self._get_playbook_name(playbook_path)
-            for key in keys:
-                play_to_path_map[key] = playbook_path
-        return play_to_path_map
-
 # For compatability
 class Runner(PlaybookShell):
     pass
@@ -0,0 +1,139 @@
+"""
+Sharded runs: the hosts of the subset split across processes.
+
+A single TaskQueueManager is bounded by one strategy loop and one results
+queue. With `shards=K` the runner resolves the hosts of `limit_hosts`,
+deals them round-robin (in sorted order) into K shards and forks one
+process per shard. Each shard runs every playbook for its hosts with its
+own PlaybookExecutor and TQM, exactly like an unsharded run limited to
+those hosts. When all shards are done their stats are merged into one
+SubspaceAggregateStats, their registered results into one dict, and their
+return codes into one:
+
+    runner = Runner.factory(host_file, playbook_dir, logger, shards=4)
+    runner.run()             # 0 only if every shard returned 0
+    runner.stats             # merged SubspaceAggregateStats
+    runner.results           # {host: registered vars}, every shard
+    runner.sharded.shards    # [(host names, return code), ...]
+
+Checkpoint and skip_unchanged files are written per shard (`<path>.shard-N`)
+so that shards never overwrite each other; resuming needs the same subset
+and number of shards. Metrics and profiles only cover the parent process.
+"""
+import json
+import multiprocessing
+import traceback
+
+from ansible.compat.six.moves import queue as Queue
+
+from subspace.checkpoint import _to_json
+from subspace.exceptions import ShardError
+from subspace.stats import SubspaceAggregateStats
+
+
+__all__ = ['ShardedResult', 'split_hosts', 'run_shards']
+
+
+def split_hosts(host_names, shards):
+    """
+    Deal the sorted `host_names` round-robin into at most `shards` lists.
+    """
+    host_names = sorted(host_names)
+    count = max(min(int(shards), len(host_names)), 1)
+    return [host_names[idx::count] for idx in range(count)]
+
+
+def shard_path(path, index):
+    return "%s.shard-%d" % (path, index)
+
+
+class ShardedResult(object):
+    """
+    The merged outcome of a sharded run.
+
+    :rc: Return codes of the shards OR'ed together (0: all succeeded).
+    :stats: SubspaceAggregateStats of every shard, merged.
+    :results: Registered results of every shard, by host.
+    :shards: (host names, return code) of each shard.
+    """
+
+    def __init__(self):
+        self.rc = 0
+        self.stats = SubspaceAggregateStats()
+        self.results = {}
+        self.shards = []
+
+    def __repr__(self):
+        return "ShardedResult(rc=%r, shards=%d)" % (self.rc, len(self.shards))
+
+    def add(self, host_names, rc, stats, results):
+        self.rc |= rc
+        self.stats.merge(stats)
+        self.results.update(results)
+        self.shards.append((host_names, rc))
+
+
+def _context():
+    # Shards inherit the loaded runner (playbooks, config overlay, logger)
+    # by forking, whatever the platform's default start method is.
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+def _run_shard(runner, index, host_names, results_queue):
+    try:
+        rc = runner._run_shard(index, host_names)
+        # Registered results may hold objects that do not pickle
+        results = json.loads(json.dumps(runner.results, default=_to_json))
+        results_queue.put((index, rc, runner.stats.to_bytes(), results, None))
+    except BaseException:
+        results_queue.put((index, None, None, None, traceback.format_exc()))
+
+
+def run_shards(runner, host_groups, poll_interval=1.0):
+    """
+    Run `runner` once per list of host names in `host_groups`, each in its
+    own process, and return the merged ShardedResult.
+    Raises ShardError if any shard raised or died.
+    """
+    context = _context()
+    results_queue = context.Queue()
+    processes = []
+    for (index, host_names) in enumerate(host_groups):
+        process = context.Process(
+            target=_run_shard, args=(runner, index, host_names, results_queue),
+            name="subspace-shard-%d" % index)
+        process.start()
+        processes.append(process)
+
+    outcomes = {}
+    errors = {}
+    while len(outcomes) + len(errors) < len(processes):
+        try:
+            (index, rc, stats, results, error) = results_queue.get(timeout=poll_interval)
+        except Queue.Empty:
+            # A shard killed before reporting never will
+            for (index, process) in enumerate(processes):
+                if index in outcomes or index in errors or process.is_alive():
+                    continue
+                if process.exitcode:
+                    errors[index] = "exited with code %s" % process.exitcode
+            continue
+        if error:
+            errors[index] = error
+        else:
+            outcomes[index] = (rc, stats, results)
+    for process in processes:
+        process.join()
+
+    if errors:
+        raise ShardError("\n".join(
+            "Shard %d (%s) failed: %s" % (index, ', '.join(host_groups[index]), errors[index])
+            for index in sorted(errors)))
+
+    sharded = ShardedResult()
+    for (index, host_names) in enumerate(host_groups):
+        (rc, stats, results) = outcomes[index]
+        sharded.add(host_names, rc, SubspaceAggregateStats.from_bytes(stats), results)
+    return sharded
@@ -0,0 +1,193 @@
+"""
+Warm SSH ControlMaster connections shared by consecutive runs.
+
+Ansible's ssh connection multiplexes over ControlPersist masters, but the
+first task on every host pays for a full SSH handshake, and the control
+sockets live under a path only Ansible knows. An SSHMasterPool:
+
+* points Ansible at a stable ControlPath directory with a ControlPath
+  derived only from host, port and user (`%C`), and a longer ControlPersist,
+  through the runner's ConfigOverlay,
+* opens (or finds alive) the master of every host in the subset in parallel
+  before the first play, so every run of a long-lived service that passes
+  the same pool reuses the live masters,
+* counts masters opened, reused and failed, per warm-up and overall,
+* closes the masters on `teardown()`.
+
+    pool = SSHMasterPool(persist='30m')
+    Runner.factory(host_file, playbook_dir, logger, ssh_pool=pool).run()
+    Runner.factory(host_file, playbook_dir, logger, ssh_pool=pool).run()
+    pool.stats  # {'opened': 10, 'reused': 10, 'failed': 0, ...}
+    pool.teardown()
+"""
+import os
+import subprocess
+import threading
+from multiprocessing.pool import ThreadPool
+
+from subspace.probe import PROBED_CONNECTIONS, connection_vars
+
+
+__all__ = ['SSHMasterPool']
+
+DEFAULT_CONTROL_PATH_DIR = os.path.join('~', '.subspace', 'cp')
+
+OPENED = 'opened'
+REUSED = 'reused'
+FAILED = 'failed'
+
+
+class SSHMasterPool(object):
+    """
+    :control_path_dir: Directory holding the control sockets.
+    :persist: ControlPersist value (how long idle masters stay up).
+    :timeout: ConnectTimeout for opening a master.
+    :max_workers: Masters opened at the same time.
+    :ssh_executable: ssh binary to run.
+    :ssh_args: Extra ssh options used by Ansible and the warm-up alike.
+    """
+
+    def __init__(self, control_path_dir=None, persist='30m', timeout=10,
+                 max_workers=32, ssh_executable='ssh', ssh_args='-C'):
+        self.control_path_dir = os.path.expanduser(control_path_dir or DEFAULT_CONTROL_PATH_DIR)
+        self.persist = persist
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.ssh_executable = ssh_executable
+        self.ssh_args = ssh_args
+        self.hosts = {}
+        self.stats = {'warmups': 0, OPENED: 0, REUSED: 0, FAILED: 0, 'closed': 0}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "SSHMasterPool(%r)" % (self.control_path_dir,)
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a pool from the `ssh_pool` option: None/False (disabled), True
+        (defaults), a dict of keyword args or an SSHMasterPool (shared).
+        """
+        if not value:
+            return None
+        if isinstance(value, SSHMasterPool):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls()
+
+    @property
+    def control_path(self):
+        return os.path.join(self.control_path_dir, '%C')
+
+    def ansible_settings(self):
+        """
+        ansible.constants settings making Ansible use this pool's masters.
+        """
+        return {
+            'ANSIBLE_SSH_ARGS': '%s -o ControlMaster=auto -o ControlPersist=%s' % (self.ssh_args, self.persist),
+            'ANSIBLE_SSH_CONTROL_PATH_DIR': self.control_path_dir,
+            'ANSIBLE_SSH_CONTROL_PATH': '%(directory)s/%%C',
+        }
+
+    def targets(self, inventory, options):
+        """
+        Return (host name, address, port, user, private key) for every host
+        in the current subset that connects over SSH and whose connection
+        vars resolve before the run (see subspace.probe.connection_vars).
+        """
+        targets = []
+        for host in inventory.get_hosts():
+            host_vars = connection_vars(inventory, host)
+            if host_vars is None:
+                continue
+            connection = host_vars.get('ansible_connection', options.connection or 'smart')
+            if connection not in PROBED_CONNECTIONS:
+                continue
+            targets.append((
+                host.name,
+                host_vars.get('ansible_host') or host_vars.get('ansible_ssh_host') or host.name,
+                host_vars.get('ansible_port') or host_vars.get('ansible_ssh_port'),
+                host_vars.get('ansible_user') or host_vars.get('ansible_ssh_user') or options.remote_user,
+                host_vars.get('ansible_ssh_private_key_file') or options.private_key_file,
+            ))
+        return targets
+
+    def _command(self, target, *args):
+        (name, address, port, user, key) = target
+        command = [self.ssh_executable] + self.ssh_args.split()
+        command += ['-o', 'ControlMaster=auto',
+                    '-o', 'ControlPersist=%s' % self.persist,
+                    '-o', 'ControlPath=%s' % self.control_path,
+                    '-o', 'BatchMode=yes',
+                    '-o', 'ConnectTimeout=%s' % self.timeout]
+        from ansible import constants as C
+        if not C.HOST_KEY_CHECKING:
+            command += ['-o', 'StrictHostKeyChecking=no']
+        if port:
+            command += ['-o', 'Port=%s' % port]
+        if user:
+            command += ['-o', 'User=%s' % user]
+        if key:
+            command += ['-o', 'IdentityFile="%s"' % os.path.expanduser(key)]
+        return command + list(args) + [address]
+
+    def _run(self, command):
+        # The master daemonizes and keeps its stdio; never wait on pipes
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(command, stdin=devnull, stdout=devnull, stderr=devnull)
+
+    def _warm(self, target):
+        if self._run(self._command(target, '-O', 'check')) == 0:
+            return (target, REUSED)
+        if self._run(self._command(target) + ['exit']) == 0:
+            return (target, OPENED)
+        return (target, FAILED)
+
+    def warm_up(self, targets):
+        """
+        Open or reuse the master of every target in parallel.
+        Returns a dict of host name to 'opened', 'reused' or 'failed'.
+        """
+        if not targets:
+            return {}
+        if not os.path.isdir(self.control_path_dir):
+            os.makedirs(self.control_path_dir, 0o700)
+        pool = ThreadPool(min(self.max_workers, len(targets)))
+        try:
+            results = pool.map(self._warm, targets)
+        finally:
+            pool.close()
+            pool.join()
+
+        status = {}
+        with self._lock:
+            self.stats['warmups'] += 1
+            for (target, result) in results:
+                status[target[0]] = result
+                self.stats[result] += 1
+                if result != FAILED:
+                    self.hosts[target[0]] = target
+        return status
+
+    def teardown(self, host_names=None):
+        """
+        Close the masters of `host_names` (default: every host warmed up).
+        Returns how many were closed.
+        """
+        with self._lock:
+            if host_names is None:
+                host_names = list(self.hosts)
+            targets = [self.hosts.pop(name) for name in host_names if name in self.hosts]
+        if not targets:
+            return 0
+        pool = ThreadPool(min(self.max_workers, len(targets)))
+        try:
+            results = pool.map(lambda target: self._run(self._command(target, '-O', 'exit')), targets)
+        finally:
+            pool.close()
+            pool.join()
+        closed = len([rc for rc in results if rc == 0])
+        with self._lock:
+            self.stats['closed'] += closed
+        return closed
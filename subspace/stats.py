@@ -2,14 +2,26 @@
 This Custom stats module allows more detailed information to be recorded, including:
 * What playbook is failed/unreachable
 * What task in the playbook failed/unreachable
+
+Stats serialize to compact JSON (`to_json`) or zlib-compressed bytes
+(`to_bytes`), with every (path, play, role, task) key stored once, and stats of
+separate runs (shards, workers, history) combine with `merge`/`merge_stats`.
 """
+import json
+import zlib
+
 DEBUG = False
 
+SERIAL_VERSION = 1
+BINARY_MAGIC = b'SSTATS1\0'
+# Per-host counters summed by merge
+COUNTERS = ['ok', 'failures', 'dark', 'changed', 'skipped']
+
 
 class SubspaceAggregateStats:
     ''' holds stats about per-host activity during playbook runs '''
 
-    def __init__(self, play_to_path_map):
+    def __init__(self, play_to_path_map=None):
         """
         Completed dict looks like this:
         self.ok= {
@@ -19,7 +31,9 @@ class SubspaceAggregateStats:
             },
             ...
         """
-        self.play_to_path_map = play_to_path_map
+        # Playbook path of every loaded play, keyed by play UUID (which
+        # copies of the play share), see register_play
+        self.play_to_path_map = dict(play_to_path_map or {})
         """
         Completed processed_playbooks looks like this:
         self.processed_playbooks = {
@@ -39,6 +53,50 @@ class SubspaceAggregateStats:
         self.dark      = {}
         self.changed   = {}
         self.skipped   = {}
+        """
+        With adaptive forks, the fork limit in effect when each task was queued:
+        self.forks = {
+            ('Path: ...', 'Playbook: ...', 'Role: ...', 'Task: ...'): {
+                'min': 4, 'max': 12, 'last': 12
+            }
+        }
+        """
+        self.forks = {}
+        """
+        Hosts removed from the run by the fast-fail policy:
+        self.fast_fail = {
+            'vm64-214.iplantcollaborative.org': {
+                'reason': 'unreachable', 'playbook': '/path/to/00_check.yml', 'action': 'pruned'
+            }
+        }
+        """
+        self.fast_fail = {}
+        """
+        Playbooks skipped per host because nothing changed since a clean run:
+        self.skipped_unchanged = {
+            'vm64-214.iplantcollaborative.org': ['/path/to/00_check.yml', ...]
+        }
+        """
+        self.skipped_unchanged = {}
+        # Hosts the pre-flight probe could not reach: {host: error}
+        self.probe_failures = {}
+        # SSH masters warmed up before the run: {host: 'opened'|'reused'|'failed'}
+        self.ssh_connections = {}
+        """
+        Time from queueing each task to its final result, per host:
+        self.durations = {
+          'vm64-214.iplantcollaborative.org': {
+            ('Path: ...', 'Playbook: ...', 'Role: ...', 'Task: ...'): {
+                'seconds': 3.5, 'count': 1, 'status': 'ok'
+              }
+            }
+          }
+        """
+        self.durations = {}
+
+    def register_play(self, play, playbook_path):
+        ''' attribute the results of `play` to `playbook_path` '''
+        self.play_to_path_map[play._uuid] = playbook_path
 
     def original_increment(self, what, host):
         prev = (getattr(self, what)).get(host, 0)
@@ -108,19 +166,22 @@ class SubspaceAggregateStats:
         stat_dict[host] = host_playbook_dict
         return
 
-    def _increment_tuple_dict(self, what, host, play, task):
-        if not DEBUG and what in ['skipped', 'ok', 'changed']:
-            return
+    def _get_tuple_key(self, play, task):
         playbook_key = self._get_playbook_key(play, use_path=True)
         task_name, role_name = self._get_task_and_role(task)
-
-        host_dict = self.processed_playbooks.get(host, {})
-        playbook_path = self.play_to_path_map.get(play.name, "N/A")
-        tuple_key = (
+        playbook_path = self.play_to_path_map.get(getattr(play, '_uuid', None), "N/A")
+        return (
             "Path: %s" % playbook_path,
             "Playbook: %s" % playbook_key,
             "Role: %s" % role_name,
             "Task: %s" % task_name)
+
+    def _increment_tuple_dict(self, what, host, play, task):
+        if not DEBUG and what in ['skipped', 'ok', 'changed']:
+            return
+
+        host_dict = self.processed_playbooks.get(host, {})
+        tuple_key = self._get_tuple_key(play, task)
         status_dict = host_dict.get(tuple_key, {})
 
         status_count = status_dict.get(what, 0)
@@ -128,6 +189,156 @@ class SubspaceAggregateStats:
         host_dict[tuple_key] = status_dict
         self.processed_playbooks[host] = host_dict
 
+    def record_forks(self, play, task, forks):
+        ''' remember the adaptive fork limit used to queue a task '''
+        tuple_key = self._get_tuple_key(play, task)
+        fork_dict = self.forks.get(tuple_key)
+        if fork_dict is None:
+            self.forks[tuple_key] = {'min': forks, 'max': forks, 'last': forks}
+            return
+        fork_dict['min'] = min(fork_dict['min'], forks)
+        fork_dict['max'] = max(fork_dict['max'], forks)
+        fork_dict['last'] = forks
+
+    def record_duration(self, host, play, task, seconds, status):
+        ''' add the time a task took on a host, with its last status '''
+        host_dict = self.durations.setdefault(host, {})
+        tuple_key = self._get_tuple_key(play, task)
+        duration_dict = host_dict.get(tuple_key)
+        if duration_dict is None:
+            host_dict[tuple_key] = {'seconds': seconds, 'count': 1, 'status': status}
+            return
+        duration_dict['seconds'] += seconds
+        duration_dict['count'] += 1
+        duration_dict['status'] = status
+
+    def record_fast_fail(self, host, reason, playbook, action):
+        ''' remember why the fast-fail policy pruned a host or aborted the run '''
+        self.fast_fail[host] = dict(reason=reason, playbook=playbook, action=action)
+
+    def record_probe_failure(self, host, error):
+        ''' mark a host the pre-flight probe could not reach as unreachable '''
+        self.probe_failures[host] = error
+        self.increment('dark', host)
+
+    def record_unchanged_skip(self, host, playbook):
+        ''' remember a playbook skipped for a host because its inputs did not change '''
+        self.skipped_unchanged.setdefault(host, []).append(playbook)
+
+    def merge(self, other):
+        ''' add the stats of another run over other hosts (ex: a shard) to these '''
+        self.play_to_path_map.update(other.play_to_path_map)
+        for host in other.processed:
+            self.processed[host] = 1
+        for what in COUNTERS:
+            counts = getattr(self, what)
+            for (host, count) in getattr(other, what).items():
+                counts[host] = counts.get(host, 0) + count
+        for (host, other_host_dict) in other.processed_playbooks.items():
+            host_dict = self.processed_playbooks.setdefault(host, {})
+            for (tuple_key, other_status_dict) in other_host_dict.items():
+                status_dict = host_dict.setdefault(tuple_key, {})
+                for (what, count) in other_status_dict.items():
+                    status_dict[what] = status_dict.get(what, 0) + count
+        for (tuple_key, other_fork_dict) in other.forks.items():
+            fork_dict = self.forks.get(tuple_key)
+            if fork_dict is None:
+                self.forks[tuple_key] = dict(other_fork_dict)
+                continue
+            fork_dict['min'] = min(fork_dict['min'], other_fork_dict['min'])
+            fork_dict['max'] = max(fork_dict['max'], other_fork_dict['max'])
+            fork_dict['last'] = other_fork_dict['last']
+        for (host, fast_fail) in other.fast_fail.items():
+            self.fast_fail[host] = dict(fast_fail)
+        for (host, playbooks) in other.skipped_unchanged.items():
+            self.skipped_unchanged.setdefault(host, []).extend(playbooks)
+        self.probe_failures.update(other.probe_failures)
+        self.ssh_connections.update(other.ssh_connections)
+        for (host, other_host_dict) in other.durations.items():
+            host_dict = self.durations.setdefault(host, {})
+            for (tuple_key, other_duration_dict) in other_host_dict.items():
+                duration_dict = host_dict.get(tuple_key)
+                if duration_dict is None:
+                    host_dict[tuple_key] = dict(other_duration_dict)
+                    continue
+                duration_dict['seconds'] += other_duration_dict['seconds']
+                duration_dict['count'] += other_duration_dict['count']
+                duration_dict['status'] = other_duration_dict['status']
+        return self
+
+    def to_dict(self):
+        ''' return these stats as JSON-compatible data, tuple keys listed once '''
+        keys = []
+        key_index = {}
+
+        def index(tuple_key):
+            if tuple_key not in key_index:
+                key_index[tuple_key] = len(keys)
+                keys.append(list(tuple_key))
+            return key_index[tuple_key]
+
+        data = dict(
+            version=SERIAL_VERSION,
+            play_to_path_map=self.play_to_path_map,
+            processed=sorted(self.processed),
+            processed_playbooks=dict(
+                (host, [[index(tuple_key), status_dict] for (tuple_key, status_dict) in sorted(host_dict.items())])
+                for (host, host_dict) in sorted(self.processed_playbooks.items())),
+            forks=[[index(tuple_key), fork_dict] for (tuple_key, fork_dict) in sorted(self.forks.items())],
+            fast_fail=self.fast_fail,
+            skipped_unchanged=self.skipped_unchanged,
+            probe_failures=self.probe_failures,
+            ssh_connections=self.ssh_connections,
+            durations=dict(
+                (host, [[index(tuple_key), duration_dict] for (tuple_key, duration_dict) in sorted(host_dict.items())])
+                for (host, host_dict) in sorted(self.durations.items())),
+        )
+        for what in COUNTERS:
+            data[what] = getattr(self, what)
+        data['keys'] = keys
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        ''' rebuild stats from the output of to_dict '''
+        if data.get('version') != SERIAL_VERSION:
+            raise ValueError("Unsupported stats version: %r" % (data.get('version'),))
+        keys = [tuple(tuple_key) for tuple_key in data['keys']]
+        stats = cls(data['play_to_path_map'])
+        stats.processed = dict((host, 1) for host in data['processed'])
+        for what in COUNTERS:
+            setattr(stats, what, dict(data[what]))
+        stats.processed_playbooks = dict(
+            (host, dict((keys[idx], status_dict) for (idx, status_dict) in entries))
+            for (host, entries) in data['processed_playbooks'].items())
+        stats.forks = dict((keys[idx], fork_dict) for (idx, fork_dict) in data['forks'])
+        stats.fast_fail = dict(data['fast_fail'])
+        stats.skipped_unchanged = dict(data['skipped_unchanged'])
+        stats.probe_failures = dict(data['probe_failures'])
+        stats.ssh_connections = dict(data['ssh_connections'])
+        stats.durations = dict(
+            (host, dict((keys[idx], duration_dict) for (idx, duration_dict) in entries))
+            for (host, entries) in data.get('durations', {}).items())
+        return stats
+
+    def to_json(self):
+        ''' serialize to compact JSON text '''
+        return json.dumps(self.to_dict(), separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def to_bytes(self):
+        ''' serialize to compressed binary, ex: to send to another process '''
+        return BINARY_MAGIC + zlib.compress(self.to_json().encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(BINARY_MAGIC):
+            raise ValueError("Not serialized SubspaceAggregateStats")
+        return cls.from_json(zlib.decompress(data[len(BINARY_MAGIC):]).decode('utf-8'))
+
     def _increment_playbook_dict(self, what, host, play, task):
         if not DEBUG and what in ['skipped', 'ok', 'changed']:
             return
@@ -151,6 +362,16 @@ class SubspaceAggregateStats:
 
         return self.processed_playbooks.get(host, {})
 
+    def summarize_durations(self, host):
+        ''' return the task durations of a particular host '''
+
+        return self.durations.get(host, {})
+
+    def summarize_forks(self):
+        ''' return the fork limits recorded per task (adaptive forks only) '''
+
+        return self.forks
+
     def summarize(self, host):
         ''' return information about a particular host '''
 
@@ -162,3 +383,14 @@ class SubspaceAggregateStats:
             skipped     = self.skipped.get(host, {})
         )
 
+
+def merge_stats(*stats):
+    """
+    Return new stats combining `stats`, left to right, without changing them.
+    The merge is associative: counts add up, fork limits keep their min/max and
+    the last one, and per-host records of later stats win.
+    """
+    merged = SubspaceAggregateStats()
+    for other in stats:
+        merged.merge(other)
+    return merged
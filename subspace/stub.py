@@ -0,0 +1,158 @@
+"""
+Settings and canned results for the 'stub' connection plugin.
+
+The stub connection (subspace/plugins/connection/stub.py) never leaves the
+controller: every module execution returns a canned, optionally templated,
+JSON result after a configurable delay. This makes it possible to load-test
+SubspaceTaskQueueManager, the subspace strategy and SubspaceAggregateStats
+against thousands of hosts on a single machine:
+
+    Runner.factory(host_file, playbook_dir, logger,
+                   connection='stub',
+                   stub_options={'latency': 0.05, 'failure_rate': 0.01})
+
+Ansible forks a worker per task, so settings configured in the controller
+before the run are seen by every worker.
+"""
+import hashlib
+import random
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+__all__ = ['configure', 'reset', 'get_settings', 'is_unreachable',
+           'latency', 'module_result', 'reseed', 'DEFAULT_RESULTS']
+
+
+DEFAULT_SETTINGS = {
+    # Seconds slept before returning each module result.
+    'latency': 0.0,
+    # The latency varies uniformly by +/- this many seconds.
+    'latency_jitter': 0.0,
+    # Fraction (0.0 - 1.0) of module executions returning 'failed'.
+    'failure_rate': 0.0,
+    # Fraction (0.0 - 1.0) of hosts that cannot be connected to.
+    'unreachable_rate': 0.0,
+    # Whether module results report 'changed'.
+    'changed': False,
+    # Module name -> result dict, merged over DEFAULT_RESULTS.
+    'results': {},
+    # With a seed, failures are chosen per (seed, host, module) so that
+    # repeated runs fail the same way. Without one they are random.
+    'seed': None,
+}
+
+# Strings in results may use {host} and {module}.
+DEFAULT_RESULTS = {
+    'setup': {
+        'changed': False,
+        'ansible_facts': {
+            'ansible_hostname': '{host}',
+            'ansible_fqdn': '{host}',
+            'ansible_system': 'Linux',
+            'ansible_os_family': 'Stub',
+            'ansible_distribution': 'Stub',
+            'ansible_distribution_version': '1.0',
+        },
+    },
+    'stat': {'changed': False, 'stat': {'exists': False}},
+    'command': {'rc': 0, 'stdout': '', 'stderr': '', 'stdout_lines': []},
+    'shell': {'rc': 0, 'stdout': '', 'stderr': '', 'stdout_lines': []},
+    'ping': {'changed': False, 'ping': 'pong'},
+}
+
+_settings = dict(DEFAULT_SETTINGS)
+
+
+def configure(**settings):
+    """
+    Update the stub settings. Unknown names raise a ValueError.
+    """
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(
+            "Unknown stub settings: %s. Valid settings are: %s"
+            % (', '.join(sorted(unknown)), ', '.join(sorted(DEFAULT_SETTINGS))))
+    _settings.update(settings)
+    return get_settings()
+
+
+def reset():
+    _settings.clear()
+    _settings.update(DEFAULT_SETTINGS)
+
+
+def get_settings():
+    return dict(_settings)
+
+
+def reseed():
+    """
+    Forked workers inherit the controller's random state; call this once per
+    worker so they do not all draw the same numbers.
+    """
+    random.seed()
+
+
+def _fraction(key):
+    """
+    Map `key` onto [0, 1) deterministically.
+    """
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16) / float(2 ** 32)
+
+
+def _render(value, context):
+    if isinstance(value, dict):
+        return dict((key, _render(item, context)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_render(item, context) for item in value]
+    if isinstance(value, string_types) and '{' in value:
+        try:
+            return value.format(**context)
+        except (KeyError, IndexError, ValueError):
+            return value
+    return value
+
+
+def is_unreachable(host):
+    rate = _settings['unreachable_rate']
+    if not rate:
+        return False
+    return _fraction('%s:%s' % (_settings['seed'], host)) < rate
+
+
+def latency():
+    delay = _settings['latency']
+    jitter = _settings['latency_jitter']
+    if jitter:
+        delay += random.uniform(-jitter, jitter)
+    return max(delay, 0.0)
+
+
+def module_result(host, module):
+    """
+    Return the canned result dict for running `module` on `host`.
+    """
+    context = {'host': host, 'module': module}
+    rate = _settings['failure_rate']
+    if rate:
+        if _settings['seed'] is None:
+            chance = random.random()
+        else:
+            chance = _fraction('%s:%s:%s' % (_settings['seed'], host, module))
+        if chance < rate:
+            return {
+                'failed': True,
+                'changed': False,
+                'rc': 1,
+                'msg': 'stub failure of %s on %s' % (module, host),
+            }
+
+    result = {'changed': _settings['changed'],
+              'msg': 'stub %s on %s' % (module, host)}
+    canned = _settings['results'].get(module, DEFAULT_RESULTS.get(module))
+    if canned:
+        result.update(_render(canned, context))
+    return result
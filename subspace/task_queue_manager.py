@@ -6,21 +6,39 @@ import os
 from ansible.errors import AnsibleError
 from ansible.executor.play_iterator import PlayIterator
 from ansible.playbook.play_context import PlayContext
-from ansible.plugins import strategy_loader
-from ansible.template import Templar
+from ansible.plugins import connection_loader, strategy_loader
 from ansible.utils.helpers import pct_to_int
 from ansible.vars.hostvars import HostVars
 from ansible.vars.reserved import warn_if_reserved
 
 from ansible.executor.task_queue_manager import TaskQueueManager
 
+from subspace import metrics, profiler
+from subspace.adaptive import AdaptiveForks
+from subspace.handlers import NotifiedHandlers
+from subspace.template_cache import SubspaceTemplar
+
 try:
     from __main__ import display
 except ImportError:
     from ansible.utils.display import Display
     display = Display()
 
-__all__ = ['SubspaceTaskQueueManager']
+__all__ = ['SubspacePlayContext', 'SubspaceTaskQueueManager']
+
+
+class SubspacePlayContext(PlayContext):
+
+    '''
+    PlayContext with tag sets of its own: Ansible's default to one set shared
+    by every PlayContext, which set_options updates in place, so the tags of
+    a run would filter every later run of the process.
+    '''
+
+    def set_options(self, options):
+        self.only_tags = set()
+        self.skip_tags = set()
+        super(SubspacePlayContext, self).set_options(options)
 
 
 class SubspaceTaskQueueManager(TaskQueueManager):
@@ -29,6 +47,8 @@ class SubspaceTaskQueueManager(TaskQueueManager):
     The SubspaceTaskQueueManager will inject itself as the default strategy to retrieve improved logging
     '''
     default_strategy = 'subspace'  # Use the subspace strategy by default.
+    free_strategy = 'subspace_free'  # Used for plays with 'strategy: free'
+    _fork_controller = None  # AdaptiveForks for the current play, if enabled
 
     def run(self, play):
         '''
@@ -41,14 +61,16 @@ class SubspaceTaskQueueManager(TaskQueueManager):
 
         if not self._callbacks_loaded:
             self.load_callbacks()
+        self._ensure_subspace_connections()
 
-        all_vars = self._variable_manager.get_vars(loader=self._loader, play=play)
-        warn_if_reserved(all_vars)
-        templar = Templar(loader=self._loader, variables=all_vars)
+        with profiler.phase('play_setup'):
+            all_vars = self._variable_manager.get_vars(loader=self._loader, play=play)
+            warn_if_reserved(all_vars)
+            templar = SubspaceTemplar(loader=self._loader, variables=all_vars)
 
-        new_play = play.copy()
-        new_play.post_validate(templar)
-        new_play.handlers = new_play.compile_roles_handlers() + new_play.handlers
+            new_play = play.copy()
+            new_play.post_validate(templar)
+            new_play.handlers = new_play.compile_roles_handlers() + new_play.handlers
 
         self.hostvars = HostVars(
             inventory=self._inventory,
@@ -68,11 +90,23 @@ class SubspaceTaskQueueManager(TaskQueueManager):
                 serial_items = [serial_items]
             max_serial = max([pct_to_int(x, num_hosts) for x in serial_items])
 
-        contenders = [self._options.forks, max_serial, num_hosts]
+        # With adaptive forks the pool is sized at the upper bound and the
+        # controller limits how many of its workers are busy at once.
+        self._fork_controller = self._get_fork_controller()
+        forks = self._options.forks
+        if self._fork_controller:
+            forks = self._fork_controller.max_forks
+
+        contenders = [forks, max_serial, num_hosts]
         contenders = [v for v in contenders if v is not None and v > 0]
         self._initialize_processes(min(contenders))
+        metrics.inc('subspace_tqm_plays_total')
+        metrics.set_gauge('subspace_tqm_workers', len(self._workers))
+        if self._fork_controller:
+            self._fork_controller.start(len(self._workers))
+            metrics.set_gauge('subspace_tqm_effective_forks', self._fork_controller.forks)
 
-        play_context = PlayContext(new_play, self._options, self.passwords, self._connection_lockfile.fileno())
+        play_context = SubspacePlayContext(new_play, self._options, self.passwords, self._connection_lockfile.fileno())
         for callback_plugin in self._callback_plugins:
             if hasattr(callback_plugin, 'set_play_context'):
                 callback_plugin.set_play_context(play_context)
@@ -91,7 +125,7 @@ class SubspaceTaskQueueManager(TaskQueueManager):
 
         # IF the method for loading strategy fails,
         #  this hack will ensure
-        # 'Subspace' linear strategy is what gets used.
+        # 'Subspace' linear (or free) strategy is what gets used.
         strategy = self._ensure_subspace_plugin(new_play)
         # END subspace snippet
         ##################
@@ -126,7 +160,8 @@ class SubspaceTaskQueueManager(TaskQueueManager):
             self._start_at_done = True
 
         # and run the play using the strategy and cleanup on way out
-        play_return = strategy.run(iterator, play_context)
+        with profiler.phase('strategy'):
+            play_return = strategy.run(iterator, play_context)
 
         # now re-save the hosts that failed from the iterator to our internal list
         for host_name in iterator.get_failed_hosts():
@@ -136,11 +171,41 @@ class SubspaceTaskQueueManager(TaskQueueManager):
         self._cleanup_processes()
         return play_return
 
+    def _initialize_notified_handlers(self, play):
+        # Track notified hosts in ordered sets instead of lists
+        if not isinstance(self._notified_handlers, NotifiedHandlers):
+            self._notified_handlers = NotifiedHandlers()
+        super(SubspaceTaskQueueManager, self)._initialize_notified_handlers(play)
+
+    def send_callback(self, method_name, *args, **kwargs):
+        with metrics.timer('subspace_callback_seconds', callback=method_name), profiler.phase('callback'):
+            return super(SubspaceTaskQueueManager, self).send_callback(method_name, *args, **kwargs)
+
+    def _get_fork_controller(self):
+        adaptive_forks = getattr(self._options, 'adaptive_forks', None)
+        if not adaptive_forks:
+            return None
+        return AdaptiveForks.from_option(adaptive_forks, self._options.forks)
+
+    def _ensure_subspace_connections(self):
+        # Make subspace connection plugins (ex: 'stub') available to the workers
+        subspace_dir = os.path.dirname(__file__)
+        connection_loader.add_directory(os.path.join(subspace_dir, 'plugins/connection'))
+
     def _ensure_subspace_plugin(self, new_play):
         from subspace.plugins.strategy.subspace import StrategyModule
-
-        # NOTE: Requires *ALL* strategies to use subspace-linear for now.
-        new_play.strategy = self.default_strategy
+        from subspace.plugins.strategy.subspace_free import StrategyModule as FreeStrategyModule
+        strategies = {
+            self.default_strategy: StrategyModule,
+            self.free_strategy: FreeStrategyModule,
+        }
+
+        # NOTE: 'free' plays use subspace-free, every other strategy uses subspace-linear.
+        if new_play.strategy in ('free', self.free_strategy):
+            new_play.strategy = self.free_strategy
+        else:
+            new_play.strategy = self.default_strategy
+        strategy_class = strategies[new_play.strategy]
 
         # NOTE: Removing this line still causes failures in ansible2.3
         subspace_dir = os.path.dirname(__file__)
@@ -149,8 +214,8 @@ class SubspaceTaskQueueManager(TaskQueueManager):
         # Load subspace strategy
         strategy = strategy_loader.get(new_play.strategy, self)
 
-        if strategy is None or not isinstance(strategy, StrategyModule):
-            strategy = StrategyModule(self)
-        if not isinstance(strategy, StrategyModule):
+        if strategy is None or not isinstance(strategy, strategy_class):
+            strategy = strategy_class(self)
+        if not isinstance(strategy, strategy_class):
             raise AnsibleError("Invalid play strategy specified: %s" % new_play.strategy, obj=new_play._ds)
         return strategy
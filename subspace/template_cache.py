@@ -0,0 +1,217 @@
+"""
+Process-wide cache of compiled Jinja templates.
+
+Every Templar has its own jinja environment, so each new Templar (one per
+play post-validation, per handler name lookup, ...) compiles the same
+template strings again. SubspaceTemplar compiles through a TemplateCache
+shared by the process instead, so a string is compiled once across plays
+and runs:
+
+* entries are the compiled code of a template, keyed by its source, the
+  environment settings the code generation depends on (delimiters, trim
+  and newline options, extensions, ...) and the filters and tests known
+  to the environment; every render still builds a Template with the globals
+  (lookup, finalize) of its own Templar,
+* at most `max_entries` are kept, least recently used evicted first,
+* strings without any template marker are returned as they are, without
+  going through jinja at all.
+
+    from subspace.template_cache import shared_cache
+
+    shared_cache().stats       # {'hits': .., 'misses': .., 'evictions': .., 'literals': ..}
+    shared_cache().hit_rate()  # 0.97
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from jinja2.loaders import FileSystemLoader
+from jinja2.runtime import StrictUndefined
+
+from ansible.compat.six import string_types, text_type
+from ansible.template import AnsibleEnvironment, JINJA2_OVERRIDE, Templar
+
+from subspace import metrics
+
+
+__all__ = ['TemplateCache', 'CachingEnvironment', 'SubspaceTemplar', 'shared_cache']
+
+
+# Environment attributes the generated code depends on
+SETTINGS = (
+    'block_start_string', 'block_end_string',
+    'variable_start_string', 'variable_end_string',
+    'comment_start_string', 'comment_end_string',
+    'line_statement_prefix', 'line_comment_prefix',
+    'trim_blocks', 'lstrip_blocks', 'newline_sequence', 'keep_trailing_newline',
+    'optimized', 'autoescape', 'undefined', 'is_async')
+
+# How jinja passes the context to a filter, test or finalize function
+# (jinja 3, then jinja 2) decides the code generated for calling it
+PASS_ARG_ATTRS = (
+    'jinja_pass_arg',
+    'contextfilter', 'evalcontextfilter', 'environmentfilter',
+    'contextfunction', 'evalcontextfunction', 'environmentfunction')
+
+
+def _pass_arg(func):
+    return tuple(repr(getattr(func, attr, None)) for attr in PASS_ARG_ATTRS)
+
+
+def functions_key(filters, tests):
+    """
+    A digest of the names of `filters` and `tests` and how they are called.
+    """
+    digest = hashlib.sha1()
+    for (kind, functions) in (('filter', filters), ('test', tests)):
+        for name in sorted(functions):
+            digest.update(("%s:%s:%s\n" % (kind, name, _pass_arg(functions[name]))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def settings_key(environment):
+    """
+    The settings of `environment` the code compiled for a source depends on.
+    """
+    return (
+        type(environment),
+        tuple(getattr(environment, name, None) for name in SETTINGS),
+        tuple(sorted(environment.extensions)),
+        _pass_arg(environment.finalize) if environment.finalize is not None else None,
+        getattr(environment, 'functions_key', None))
+
+
+class TemplateCache(object):
+    """
+    :max_entries: Compiled templates kept at most.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'literals': 0}
+
+    def __repr__(self):
+        return "TemplateCache(max_entries=%r)" % (self.max_entries,)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit_rate(self):
+        """
+        Share of compilations served from the cache, None before the first.
+        """
+        lookups = self.stats['hits'] + self.stats['misses']
+        if not lookups:
+            return None
+        return float(self.stats['hits']) / lookups
+
+    def count_literal(self):
+        with self._lock:
+            self.stats['literals'] += 1
+        metrics.inc('subspace_template_cache_total', result='literal')
+
+    def compile(self, environment, source):
+        """
+        Return the code `environment` compiles `source` to, compiling it
+        on a miss.
+        """
+        key = (source, settings_key(environment))
+        with self._lock:
+            code = self._entries.pop(key, None)
+            if code is not None:
+                self._entries[key] = code
+                self.stats['hits'] += 1
+        if code is not None:
+            metrics.inc('subspace_template_cache_total', result='hit')
+            return code
+
+        # Compiled outside of the lock: a syntax error raises and is not cached
+        code = environment.compile(source)
+        with self._lock:
+            self.stats['misses'] += 1
+            self._entries[key] = code
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        metrics.inc('subspace_template_cache_total', result='miss')
+        return code
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachingEnvironment(AnsibleEnvironment):
+    """
+    AnsibleEnvironment compiling template strings through a TemplateCache.
+    Overlays (Templar.do_template makes one per call) share the cache.
+    """
+    template_cache = None
+    functions_key = None
+
+    def from_string(self, source, globals=None, template_class=None):
+        if self.template_cache is None:
+            return super(CachingEnvironment, self).from_string(source, globals=globals, template_class=template_class)
+        code = self.template_cache.compile(self, source)
+        cls = template_class or self.template_class
+        return cls.from_code(self, code, self.make_globals(globals), None)
+
+
+class SubspaceTemplar(Templar):
+    """
+    Templar compiling through `template_cache` (default: the process-wide
+    cache) and returning strings without template markers untouched.
+    """
+
+    def __init__(self, loader, shared_loader_obj=None, variables=dict(), template_cache=None):
+        super(SubspaceTemplar, self).__init__(loader, shared_loader_obj=shared_loader_obj, variables=variables)
+        self.environment = CachingEnvironment(
+            trim_blocks=True,
+            undefined=StrictUndefined,
+            extensions=self._get_extensions(),
+            finalize=self._finalize,
+            loader=FileSystemLoader(self._basedir),
+        )
+        if template_cache is None:
+            template_cache = shared_cache()
+        self.environment.template_cache = template_cache
+
+    def _is_literal(self, data):
+        return (isinstance(data, text_type) and not self._contains_vars(data)
+                and not data.startswith(JINJA2_OVERRIDE))
+
+    def template(self, variable, convert_bare=False, *args, **kwargs):
+        if not convert_bare and isinstance(variable, string_types) and not self._contains_vars(variable):
+            self.environment.template_cache.count_literal()
+            return variable
+        return super(SubspaceTemplar, self).template(variable, convert_bare, *args, **kwargs)
+
+    def do_template(self, data, preserve_trailing_newlines=True, *args, **kwargs):
+        # Jinja drops a trailing newline and normalizes line endings, even
+        # without markers: leave those strings to it
+        if self._is_literal(data) and '\r' not in data and (preserve_trailing_newlines or not data.endswith('\n')):
+            self.environment.template_cache.count_literal()
+            return data
+        if self.environment.functions_key is None:
+            # Filters and tests are loaded once per Templar
+            self.environment.functions_key = functions_key(self._get_filters(), self._get_tests())
+        return super(SubspaceTemplar, self).do_template(data, preserve_trailing_newlines, *args, **kwargs)
+
+    _do_template = do_template
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    The TemplateCache shared by every SubspaceTemplar of the process.
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = TemplateCache()
+        return _shared_cache
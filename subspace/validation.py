@@ -0,0 +1,130 @@
+"""
+Parallel syntax and validation check of playbooks.
+
+`Runner.validate_playbooks()` (and runs with `syntax=True`) load and
+validate every playbook the way a syntax check does (load, post-validate
+and compile each play), in a pool of worker processes:
+
+* playbooks are grouped by directory and every group is checked by one
+  worker, in one DataLoader, so role and include files shared by playbooks
+  of a directory are read and parsed once,
+* a failing playbook does not stop the others; each gets a report:
+
+    [{'playbook': '/path/to/00_check.yml', 'ok': True, 'error': None,
+      'plays': 2, 'tasks': 14, 'roles': ['check-network'], 'seconds': 0.12},
+     {'playbook': '/path/to/01_broken.yml', 'ok': False,
+      'error': "ERROR! 'foo' is not a valid attribute for a Play ...", ...}]
+"""
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+
+
+__all__ = ['validate_playbooks', 'group_playbooks']
+
+
+# (loader, variable_manager, inventory) of a validation worker
+_context = None
+
+
+def group_playbooks(playbook_paths):
+    """
+    Group `playbook_paths` by directory, keeping their order.
+    """
+    groups = OrderedDict()
+    for path in playbook_paths:
+        groups.setdefault(os.path.dirname(os.path.realpath(path)), []).append(path)
+    return list(groups.values())
+
+
+def _count_tasks(blocks):
+    from ansible.playbook.block import Block
+
+    count = 0
+    for block in blocks:
+        for task in block.block:
+            if isinstance(task, Block):
+                count += _count_tasks([task])
+            elif task.action != 'meta':
+                count += 1
+    return count
+
+
+def _validate_playbook(playbook_path):
+    from ansible.playbook import Playbook
+    from subspace.template_cache import SubspaceTemplar
+
+    (loader, variable_manager, inventory) = _context
+    report = dict(playbook=playbook_path, ok=True, error=None, plays=0, tasks=0, roles=[])
+    started = time.time()
+    try:
+        pb = Playbook.load(playbook_path, variable_manager=variable_manager, loader=loader)
+        inventory.set_playbook_basedir(os.path.realpath(os.path.dirname(playbook_path)))
+        roles = set()
+        for play in pb.get_plays():
+            if play._included_path is not None:
+                loader.set_basedir(play._included_path)
+            else:
+                loader.set_basedir(pb._basedir)
+            # As PlaybookExecutor.run does for syntax checks: prompted vars
+            # take their default
+            for var in play.vars_prompt or []:
+                if var['name'] not in variable_manager.extra_vars:
+                    play.vars[var['name']] = var.get('default', None)
+            all_vars = variable_manager.get_vars(loader=loader, play=play)
+            new_play = play.copy()
+            new_play.post_validate(SubspaceTemplar(loader=loader, variables=all_vars))
+            report['plays'] += 1
+            report['tasks'] += _count_tasks(new_play.compile())
+            roles.update(role.get_name() for role in new_play.get_roles())
+        report['roles'] = sorted(roles)
+    except Exception as exc:
+        report['ok'] = False
+        report['error'] = u"%s: %s" % (type(exc).__name__, exc)
+    report['seconds'] = time.time() - started
+    return report
+
+
+def _validate_group(playbook_paths):
+    return [_validate_playbook(playbook_path) for playbook_path in playbook_paths]
+
+
+def _init_worker(runner):
+    global _context
+    _context = runner._load_context()
+
+
+def validate_playbooks(runner, playbook_paths, workers=None):
+    """
+    Validate `playbook_paths` with the options, inventory and extra vars of
+    `runner`, in up to `workers` processes (default: one per CPU).
+    Returns the reports in the order of `playbook_paths`.
+    """
+    global _context
+    groups = group_playbooks(playbook_paths)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(min(int(workers), len(groups)), 1)
+
+    if workers == 1:
+        _init_worker(runner)
+        try:
+            reports = [_validate_group(group) for group in groups]
+        finally:
+            _context = None
+    else:
+        # Forked workers inherit the runner instead of unpickling it
+        context = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+        pool = context.Pool(workers, initializer=_init_worker, initargs=(runner,))
+        try:
+            reports = pool.map(_validate_group, groups, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    by_path = {}
+    for group_reports in reports:
+        for report in group_reports:
+            by_path[report['playbook']] = report
+    return [by_path[path] for path in playbook_paths]
@@ -0,0 +1,163 @@
+"""
+In-process cache of decrypted vault files.
+
+Every run builds a new DataLoader, which decrypts every vaulted vars file it
+reads again. With `vault_cache=` the loader decrypts through a VaultCache
+instead. The cache is keyed by the vault id and an HMAC of the ciphertext
+under the vault password, so a different password or ciphertext never hits.
+
+* entries expire `ttl` seconds after they were decrypted,
+* at most `max_entries` are kept, least recently used evicted first,
+* plaintexts are held in bytearrays that are overwritten with zeros when
+  they expire, are evicted or the cache is cleared.
+
+The cache can only zero its own copy: the bytes handed to Ansible on a hit
+are released like any other Python object.
+
+    cache = VaultCache(ttl=600)
+    Runner.factory(host_file, playbook_dir, logger, vault_password_file=path,
+                   vault_cache=cache).run()
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from ansible.parsing.vault import VaultLib
+from ansible.module_utils._text import to_bytes
+
+
+__all__ = ['VaultCache', 'CachingVaultLib', 'shared_cache']
+
+
+DEFAULT_VAULT_ID = 'default'
+
+
+def _zero(plaintext):
+    plaintext[:] = b'\0' * len(plaintext)
+
+
+class VaultCache(object):
+    """
+    :ttl: Seconds a decrypted payload stays cached.
+    :max_entries: Payloads kept at most.
+    """
+
+    def __init__(self, ttl=300, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __repr__(self):
+        return "VaultCache(ttl=%r, max_entries=%r)" % (self.ttl, self.max_entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def from_option(cls, value):
+        """
+        Build a cache from the `vault_cache` option: None/False (disabled),
+        True (the process-wide cache), a dict of keyword args or a VaultCache.
+        """
+        if isinstance(value, VaultCache):
+            return value
+        if not value:
+            return None
+        if isinstance(value, dict):
+            return cls(**value)
+        return shared_cache()
+
+    @staticmethod
+    def key(b_vaulttext, b_password, vault_id=DEFAULT_VAULT_ID):
+        digest = hmac.new(b_password, b_vaulttext, hashlib.sha256).hexdigest()
+        return (vault_id, digest)
+
+    def _evict(self, key):
+        # Called with the lock held
+        (expires, plaintext) = self._entries.pop(key)
+        _zero(plaintext)
+        self.stats['evictions'] += 1
+
+    def purge(self):
+        """
+        Evict the expired entries.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for (key, (expires, _)) in self._entries.items() if expires <= now]:
+                self._evict(key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if entry[0] <= time.time():
+                self._evict(key)
+                self.stats['misses'] += 1
+                return None
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self.stats['hits'] += 1
+            return bytes(entry[1])
+
+    def put(self, key, b_plaintext):
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (time.time() + self.ttl, bytearray(b_plaintext))
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        Zero and drop every entry.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def vault_lib(self, b_password, vault_id=DEFAULT_VAULT_ID):
+        """
+        A VaultLib for `b_password` that decrypts through this cache.
+        """
+        return CachingVaultLib(b_password, self, vault_id)
+
+
+class CachingVaultLib(VaultLib):
+
+    def __init__(self, b_password, cache, vault_id=DEFAULT_VAULT_ID):
+        VaultLib.__init__(self, b_password)
+        self._cache = cache
+        self._vault_id = vault_id
+
+    def decrypt(self, vaulttext, filename=None):
+        if self.b_password is None:
+            return VaultLib.decrypt(self, vaulttext, filename=filename)
+        b_vaulttext = to_bytes(vaulttext, errors='strict', encoding='utf-8')
+        key = self._cache.key(b_vaulttext, self.b_password, self._vault_id)
+        b_plaintext = self._cache.get(key)
+        if b_plaintext is None:
+            b_plaintext = VaultLib.decrypt(self, b_vaulttext, filename=filename)
+            self._cache.put(key, b_plaintext)
+        return b_plaintext
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    The VaultCache shared by every runner of the process with vault_cache=True.
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = VaultCache()
+        return _shared_cache
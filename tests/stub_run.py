@@ -0,0 +1,43 @@
+"""
+Base test case running playbooks through Runner over the stub connection.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from subspace.runner import Runner
+
+
+HOSTS = ['vm-%03d' % idx for idx in range(4)]
+
+
+class StubRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='subspace-test-')
+        self.inventory_path = os.path.join(self.root, 'hosts')
+        with open(self.inventory_path, 'w') as inventory_file:
+            inventory_file.write('[test]\n%s\n' % '\n'.join(HOSTS))
+        self.playbook_dir = os.path.join(self.root, 'playbooks')
+        os.makedirs(self.playbook_dir)
+        self.logger = logging.getLogger('subspace.test')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_playbook(self, name, content):
+        path = os.path.join(self.playbook_dir, name)
+        with open(path, 'w') as playbook_file:
+            playbook_file.write(content)
+        return path
+
+    def runner(self, **options):
+        options.setdefault('limit_hosts', ','.join(HOSTS))
+        options.setdefault('stub_options', {'seed': 0})
+        return Runner.factory(
+            self.inventory_path, self.playbook_dir, self.logger,
+            private_key_file=None, connection='stub', forks=2, **options)
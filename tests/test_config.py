@@ -0,0 +1,32 @@
+"""
+Isolation of runs by subspace.config.ConfigOverlay.
+"""
+import threading
+import unittest
+
+import ansible.constants
+
+from subspace.config import ConfigOverlay
+
+
+class ConfigOverlayTest(unittest.TestCase):
+
+    def test_empty_overlay_waits_for_an_applied_overlay(self):
+        seen = []
+
+        def run_without_settings():
+            with ConfigOverlay():
+                seen.append(getattr(ansible.constants, 'SUBSPACE_TEST_SETTING', None))
+
+        with ConfigOverlay({'SUBSPACE_TEST_SETTING': 'overlaid'}):
+            thread = threading.Thread(target=run_without_settings)
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        self.assertEqual(seen, [None])
+        self.assertFalse(hasattr(ansible.constants, 'SUBSPACE_TEST_SETTING'))
+
+
+if __name__ == '__main__':
+    unittest.main()
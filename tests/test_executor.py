@@ -0,0 +1,112 @@
+"""
+Checkpoints, skipping unchanged playbooks and fast-fail of PlaybookExecutor,
+over the stub connection.
+"""
+import os
+import unittest
+
+from subspace.checkpoint import Checkpoint
+from subspace.task_queue_manager import SubspaceTaskQueueManager
+
+from stub_run import HOSTS, StubRunTestCase
+
+
+SERIAL_PLAY = """
+- hosts: all
+  gather_facts: false
+  serial: 1
+  tasks:
+    - ping:
+"""
+
+
+class CheckpointTest(StubRunTestCase):
+
+    def test_serial_play_completes_every_host(self):
+        # The last batch of a serial play (one host) must not limit the
+        # hosts recorded as completed
+        playbook_path = self.write_playbook('00_serial.yml', SERIAL_PLAY)
+        checkpoint_path = os.path.join(self.root, 'checkpoint.json')
+        self.assertEqual(self.runner(checkpoint=checkpoint_path).run(), 0)
+        checkpoint = Checkpoint.load(checkpoint_path)
+        self.assertEqual(sorted(checkpoint.completed_hosts(playbook_path, HOSTS)), HOSTS)
+
+
+TAGGED_PLAY = """
+- hosts: all
+  gather_facts: false
+  tasks:
+    - ping:
+      tags: [quick]
+    - ping:
+"""
+
+
+class SkipUnchangedTest(StubRunTestCase):
+
+    def run_skipping(self, **options):
+        runner = self.runner(skip_unchanged=os.path.join(self.root, 'unchanged.json'), **options)
+        self.assertEqual(runner.run(), 0)
+        return sorted(runner.stats.skipped_unchanged)
+
+    def test_after_serial_play_every_host_is_hashed(self):
+        # 00 always changes, so 01 is looked up after its last batch
+        self.write_playbook('00_serial.yml', SERIAL_PLAY.replace('- ping:', '- ping:\n      changed_when: true'))
+        self.write_playbook('01_unchanged.yml', SERIAL_PLAY)
+        self.assertEqual(self.run_skipping(), [])
+        self.assertEqual(self.run_skipping(), HOSTS)
+
+    def test_tag_limited_run_does_not_stand_for_a_full_run(self):
+        self.write_playbook('00_tagged.yml', TAGGED_PLAY)
+        self.assertEqual(self.run_skipping(tags=['quick']), [])
+        self.assertEqual(self.run_skipping(), [])
+        self.assertEqual(self.run_skipping(), HOSTS)
+        self.assertEqual(self.run_skipping(skip_tags=['quick']), [])
+
+
+class TagsTest(StubRunTestCase):
+
+    def test_tags_of_a_run_do_not_filter_later_runs(self):
+        self.write_playbook('00_tagged.yml', TAGGED_PLAY)
+        for (options, ok) in (({'tags': ['quick']}, 1), ({'skip_tags': ['quick']}, 1), ({}, 2)):
+            runner = self.runner(**options)
+            self.assertEqual(runner.run(), 0)
+            self.assertEqual([runner.stats.ok.get(host) for host in HOSTS], [ok] * len(HOSTS), options)
+
+
+class FastFailTest(StubRunTestCase):
+
+    def test_prune_after_serial_play_keeps_the_other_hosts(self):
+        # vm-003, the last batch of the serial play, fails and is pruned:
+        # the other hosts still run the next playbook
+        self.write_playbook('00_serial.yml', SERIAL_PLAY + """    - fail:
+      when: inventory_hostname == 'vm-003'
+""")
+        second_path = self.write_playbook('01_next.yml', SERIAL_PLAY)
+        runner = self.runner(fast_fail={'prune': True})
+        runner.run()
+        stats = runner.stats
+        self.assertEqual(sorted(stats.fast_fail), ['vm-003'])
+        for host in HOSTS[:3]:
+            playbooks = set(tuple_key[0] for tuple_key in stats.summarize_durations(host))
+            self.assertTrue('Path: %s' % second_path in playbooks, playbooks)
+
+    def test_run_error_without_failed_hosts_stops_the_run(self):
+        self.write_playbook('00_first.yml', SERIAL_PLAY)
+        second_path = self.write_playbook('01_next.yml', SERIAL_PLAY)
+        run = SubspaceTaskQueueManager.run
+        # An error of the first playbook no host failure accounts for
+        SubspaceTaskQueueManager.run = lambda tqm, play: run(tqm, play) or tqm.RUN_ERROR
+        try:
+            runner = self.runner(fast_fail={'prune': True})
+            self.assertEqual(runner.run(), SubspaceTaskQueueManager.RUN_ERROR)
+        finally:
+            SubspaceTaskQueueManager.run = run
+        self.assertEqual(runner.stats.fast_fail, {})
+        for host in HOSTS:
+            playbooks = set(tuple_key[0] for tuple_key in runner.stats.summarize_durations(host))
+            self.assertFalse('Path: %s' % second_path in playbooks, playbooks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Log lines of the play_logger callback.
+"""
+import logging
+import os
+import unittest
+
+from ansible.plugins import callback_loader
+
+import subspace
+
+from stub_run import StubRunTestCase
+
+
+HANDLER_PLAY = """
+- hosts: all
+  gather_facts: false
+  tasks:
+    - ping:
+      changed_when: true
+      notify: say hello
+  handlers:
+    - name: say hello
+      debug:
+        msg: hello
+"""
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class PlayLoggerTest(StubRunTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        callback_loader.add_directory(os.path.join(os.path.dirname(subspace.__file__), 'plugins', 'callback'))
+
+    def run_logged(self, **options):
+        self.write_playbook('00_handler.yml', HANDLER_PLAY)
+        handler = ListHandler()
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+        try:
+            self.assertEqual(self.runner(**options).run(), 0)
+        finally:
+            self.logger.removeHandler(handler)
+        return handler.messages
+
+    def handler_headers(self, messages):
+        return [message for message in messages if message.startswith('RUNNING HANDLER')]
+
+    def test_no_handler_header_by_default(self):
+        messages = self.run_logged()
+        self.assertTrue([message for message in messages if message.startswith('TASK [ping]')])
+        self.assertEqual(self.handler_headers(messages), [])
+
+    def test_handler_header_with_aggregated_logs(self):
+        self.assertEqual(self.handler_headers(self.run_logged(aggregate_logs=True)), ['RUNNING HANDLER [say hello]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Targets of the pre-flight reachability probe.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from ansible.parsing.dataloader import DataLoader
+from ansible.vars import VariableManager
+
+from subspace.inventory import InventoryData, SubspaceInventory
+from subspace.probe import ReachabilityProbe
+
+
+INVENTORY = """
+templated ansible_host="{{ address }}" address=10.0.0.1
+undefined ansible_port="{{ not_defined }}"
+local ansible_connection="{{ connection }}" connection=local
+plain
+
+[all:vars]
+ansible_port="{{ ssh_port }}"
+ssh_port=2222
+"""
+
+
+class ProbeTargetsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='subspace-test-')
+        self.inventory_path = os.path.join(self.root, 'hosts')
+        with open(self.inventory_path, 'w') as inventory_file:
+            inventory_file.write(INVENTORY)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_templated_connection_vars(self):
+        inventory = SubspaceInventory(DataLoader(), VariableManager(), host_list=self.inventory_path)
+        self.assertEqual(sorted(ReachabilityProbe().targets(inventory)), [
+            ('plain', 'plain', 2222),
+            ('templated', '10.0.0.1', 2222),
+        ])
+
+    def test_in_memory_inventory_with_templated_port(self):
+        data = InventoryData(hosts={'templated': {'ansible_port': '{{ ssh_port }}'},
+                                    'plain': {'ansible_port': 2200}},
+                             vars={'ssh_port': 2222})
+        inventory = SubspaceInventory(DataLoader(), VariableManager(), host_list=data)
+        self.assertEqual(sorted(ReachabilityProbe().targets(inventory)), [
+            ('plain', 'plain', 2200),
+            ('templated', 'templated', 2222),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Run plays end to end through Runner over the stub connection, with the
+subspace linear and free strategies.
+"""
+import unittest
+
+from stub_run import HOSTS, StubRunTestCase
+
+
+PLAY = """
+- name: Strategy %(strategy)s
+  hosts: all
+  gather_facts: false
+  strategy: %(strategy)s
+  tasks:
+    - name: set a fact
+      set_fact:
+        greeting: "hello {{ inventory_hostname }}"
+    - name: run a module
+      ping:
+      changed_when: true
+      notify: say hello
+  handlers:
+    - name: say hello
+      debug:
+        msg: "{{ greeting }}"
+"""
+
+
+class StrategyRunTest(StubRunTestCase):
+
+    def run_play(self, strategy):
+        self.write_playbook('play.yml', PLAY % {'strategy': strategy})
+        runner = self.runner()
+        return (runner.run(), runner.stats)
+
+    def assert_all_ok(self, rc, stats, min_ok):
+        self.assertEqual(rc, 0)
+        self.assertEqual(sorted(stats.processed), HOSTS)
+        for host in HOSTS:
+            summary = stats.summarize(host)
+            self.assertFalse(summary['failures'])
+            self.assertFalse(summary['unreachable'])
+            self.assertEqual(summary['changed'], 1)
+            self.assertTrue(summary['ok'] >= min_ok)
+
+    def test_linear(self):
+        # set_fact, ping and the notified handler
+        self.assert_all_ok(*self.run_play('linear'), min_ok=3)
+
+    def test_free(self):
+        # Ansible's free strategy only runs the handlers of the hosts
+        # notified when the first host flushes them
+        self.assert_all_ok(*self.run_play('free'), min_ok=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
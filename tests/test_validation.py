@@ -0,0 +1,48 @@
+"""
+Parallel validation of playbooks.
+"""
+import unittest
+
+from stub_run import StubRunTestCase
+
+
+PROMPTED_PLAY = """
+- hosts: "{{ target }}"
+  gather_facts: false
+  vars_prompt:
+    - name: target
+      prompt: Hosts to run on
+      default: all
+  tasks:
+    - ping:
+"""
+
+BROKEN_PLAY = """
+- hosts: all
+  not_a_play_attribute: true
+  tasks:
+    - ping:
+"""
+
+
+class ValidationTest(StubRunTestCase):
+
+    def test_reports(self):
+        prompted_path = self.write_playbook('00_prompted.yml', PROMPTED_PLAY)
+        broken_path = self.write_playbook('01_broken.yml', BROKEN_PLAY)
+        for workers in (1, 2):
+            reports = self.runner().validate_playbooks(workers=workers)
+            self.assertEqual([report['playbook'] for report in reports], [prompted_path, broken_path])
+            (prompted, broken) = reports
+            self.assertTrue(prompted['ok'], prompted['error'])
+            self.assertEqual(prompted['tasks'], 1)
+            self.assertFalse(broken['ok'])
+            self.assertTrue('not_a_play_attribute' in broken['error'])
+
+    def test_syntax_run_applies_prompt_defaults(self):
+        self.write_playbook('00_prompted.yml', PROMPTED_PLAY)
+        self.assertEqual(self.runner(syntax=True).run(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()